@@ -6,6 +6,12 @@ import yaml
 from softioc import asyncio_dispatcher, builder, softioc
 
 from odinprocservcontrol import OdinProcServConfig, OdinProcServControl
+from odinprocservcontrol.odinprocserv import (
+    DEFAULT_MONITOR_INTERVAL,
+    DEFAULT_PHASE_TIMEOUT,
+    DEFAULT_SEQUENCE_TIMEOUT,
+    DEFAULT_SLOW_CALLBACK_DURATION,
+)
 
 __all__ = ["main"]
 
@@ -40,6 +46,53 @@ def parse_args():
     parser.add_argument(
         "--ioc-delay", type=int, default=3, help="Delay before starting IOC"
     )
+    parser.add_argument(
+        "--sequence-timeout",
+        type=float,
+        default=DEFAULT_SEQUENCE_TIMEOUT,
+        help="Deadline for a whole START, STOP or RESTART",
+    )
+    parser.add_argument(
+        "--phase-timeout",
+        type=float,
+        default=DEFAULT_PHASE_TIMEOUT,
+        help="Deadline for each phase of a sequence",
+    )
+    parser.add_argument(
+        "--stop-timeout",
+        type=float,
+        help="Time to wait for each process to exit after STOP before killing it",
+    )
+    parser.add_argument(
+        "--kill-timeout",
+        type=float,
+        help="Time to wait for each process to exit after KILL",
+    )
+    parser.add_argument(
+        "--state-file", type=str, help="File to persist runtime state in"
+    )
+    parser.add_argument(
+        "--restore-state",
+        action="store_true",
+        help="Start processes on startup that should be running but are not",
+    )
+    parser.add_argument(
+        "--monitor-interval",
+        type=float,
+        default=DEFAULT_MONITOR_INTERVAL,
+        help="Time between event loop lag samples - 0 to disable",
+    )
+    parser.add_argument(
+        "--slow-callback-duration",
+        type=float,
+        default=DEFAULT_SLOW_CALLBACK_DURATION,
+        help="Event loop lag above which a sample counts as slow",
+    )
+    parser.add_argument(
+        "--log-slow-callbacks",
+        action="store_true",
+        help="Log slow callbacks with their coroutine using asyncio debug mode",
+    )
 
     parser.add_argument("--log-level", type=str, default="INFO", help="Log level")
 
@@ -72,10 +125,26 @@ def main():
         server_delay=args.server_delay,
         ioc_name=args.adodin_ioc_name,
         ioc_delay=args.ioc_delay,
+        processes=getattr(args, "processes", None) or [],
+        overrides=getattr(args, "overrides", None) or {},
+        sequence_timeout=args.sequence_timeout,
+        phase_timeout=args.phase_timeout,
+        stop_timeout=args.stop_timeout,
+        kill_timeout=args.kill_timeout,
+        state_file=args.state_file,
+        restore_state=args.restore_state,
+        sequences=getattr(args, "sequences", None) or {},
+        monitor_interval=args.monitor_interval,
+        slow_callback_duration=args.slow_callback_duration,
+        log_slow_callbacks=args.log_slow_callbacks,
     )
-    OdinProcServControl(config, args.log_level)
+    control = OdinProcServControl(config, args.log_level)
 
     dispatcher = asyncio_dispatcher.AsyncioDispatcher()
     builder.LoadDatabase()
     softioc.iocInit(dispatcher)
+    if control.monitor:
+        dispatcher(control.monitor.run)
+    if config.state_file:
+        dispatcher(control.resync)
     softioc.interactive_ioc(globals())
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Union
+
+from softioc import builder
+
+__all__ = ["LoopMonitor"]
+
+
+class LoopMonitor:
+    """Publish the health of the event loop shared by all record handlers as PVs
+
+    Every `interval` the monitor sleeps and measures how late it is woken up. This
+    lag is how long any callback would have waited to run, e.g. a button press. A
+    lag above `slow_callback_duration` means something blocked the loop and the
+    sample is counted as slow. At most one slow sample is counted per interval, so
+    this counts how often the loop was seen blocked rather than every slow callback.
+
+    Records:
+        LOOP_LAG: Lag of the latest sample in seconds
+        LOOP_LAG_MAX: Largest lag since startup in seconds
+        PENDING_TASKS: Number of tasks on the loop
+        SLOW_SAMPLES: Number of samples with lag above `slow_callback_duration`
+
+    args:
+        interval: Time between samples in seconds
+        slow_callback_duration: Lag in seconds above which a sample is counted as slow
+        log_slow_callbacks: Enable asyncio debug mode, which logs each callback that
+            runs for longer than `slow_callback_duration` along with its coroutine.
+            Debug mode adds overhead to every task, so only use it for diagnosis.
+        log_level: Logging level - e.g. DEBUG
+    """
+
+    RECORD_NAMES = ("LOOP_LAG", "LOOP_LAG_MAX", "PENDING_TASKS", "SLOW_SAMPLES")
+
+    def __init__(
+        self,
+        interval: Union[int, float],
+        slow_callback_duration: Union[int, float],
+        log_slow_callbacks: bool,
+        log_level: str,
+    ) -> None:
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._logger.setLevel(log_level)
+
+        self.interval = interval
+        self.slow_callback_duration = slow_callback_duration
+        self.log_slow_callbacks = log_slow_callbacks
+        self.max_lag = 0.0
+        self.slow_samples = 0
+
+        # Records
+        self.lag = builder.aIn("LOOP_LAG", EGU="s", PREC=4)
+        self.lag_max = builder.aIn("LOOP_LAG_MAX", EGU="s", PREC=4)
+        self.pending_tasks = builder.longIn("PENDING_TASKS")
+        self.slow_sample_count = builder.longIn("SLOW_SAMPLES")
+
+    async def run(self) -> None:
+        """Sample the loop it is running on forever"""
+        loop = asyncio.get_running_loop()
+        if self.log_slow_callbacks:
+            loop.slow_callback_duration = self.slow_callback_duration
+            loop.set_debug(True)
+
+        while True:
+            await self.sample(loop)
+
+    async def sample(self, loop: asyncio.AbstractEventLoop) -> float:
+        """Take one sample, update the records and return the lag
+
+        args:
+            loop: The loop to sample - must be the running loop
+
+        """
+        start = loop.time()
+        await asyncio.sleep(self.interval)
+        lag = max(0.0, loop.time() - start - self.interval)
+
+        pending = len(asyncio.all_tasks(loop))
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.slow_callback_duration:
+            self.slow_samples += 1
+            self._logger.warning(
+                "Event loop blocked for %.3fs with %d tasks pending", lag, pending
+            )
+
+        self.lag.set(lag)
+        self.lag_max.set(self.max_lag)
+        self.pending_tasks.set(pending)
+        self.slow_sample_count.set(self.slow_samples)
+        return lag
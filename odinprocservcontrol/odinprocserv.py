@@ -2,13 +2,65 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from dataclasses import dataclass
-from typing import Union
-
-from aioca import caput
-from softioc import builder
+import time
+from copy import deepcopy
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from aioca import CANothing, caget, caput
+from softioc import alarm, builder
+
+from .monitor import LoopMonitor
+from .sequences import (
+    Sequence,
+    SequenceTimeoutError,
+    SleepStep,
+    WaitStep,
+    compile_sequences,
+)
+from .state import (
+    RUNNING,
+    STOPPED,
+    ControlState,
+    StopTiming,
+    load_state,
+    save_state,
+)
+from .targets import (
+    DATA_ROLE,
+    ProcServTarget,
+    TargetRegistry,
+    expand_process_spec,
+    format_process_name,
+)
 
 RESTART_DELAY = 3
+DEFAULT_SEQUENCE_TIMEOUT = 120
+DEFAULT_PHASE_TIMEOUT = 30
+DEFAULT_MONITOR_INTERVAL = 1
+DEFAULT_SLOW_CALLBACK_DURATION = 0.1
+# procServControl records used to confirm a process has exited and to force it to
+# exit: <process>:STATUS reads STATUS_STOPPED (0) once the process is not running and
+# <process>:KILL is a button that kills it
+STATUS_SUFFIX = "STATUS"
+STATUS_STOPPED = 0
+KILL_SUFFIX = "KILL"
+STOP_POLL_INTERVAL = 0.5
+# Time allowed beyond its duration before a top level sleep step times out
+STEP_DEADLINE_MARGIN = 1
+# Maximum length of messages on the STATUS record, including the null terminator
+STATUS_LENGTH = 256
+# Records created by OdinProcServControl, which custom sequences may not use
+RECORD_NAMES = (
+    "START",
+    "STOP",
+    "RESTART",
+    "STATUS",
+    # Created by the command line entry point
+    "WHOAMI",
+    "HOSTNAME",
+) + LoopMonitor.RECORD_NAMES
 
 
 @dataclass
@@ -22,6 +74,29 @@ class OdinProcServConfig:
         server_delay: Delay before starting server
         ioc_name: Name of ADOdin IOC - e.g. BLXXY-EA-IOC-03
         ioc_delay: Delay before starting IOC
+        processes: Additional data processes, each an explicit list of `names` or a
+            `prefix` with a `range` or `numbers` - see `expand_process_spec`
+        overrides: Mapping of name or glob pattern to target fields to override
+            - e.g. {"BLXXY-EA-ODN-1*": {"host": "bl99y-ea-serv-02"}}
+        sequence_timeout: Deadline for a whole START, STOP or RESTART - None to
+            disable
+        phase_timeout: Deadline for each phase of a sequence, e.g. starting the
+            server - None to disable
+        stop_timeout: Default time to wait for each process to exit after STOP
+            before escalating to KILL - None to not wait for confirmation
+        kill_timeout: Default time to wait for each process to exit after KILL - None
+            to not kill processes that do not stop
+        state_file: File to persist runtime state in across restarts - None to not
+            persist state
+        restore_state: Whether to start processes at startup if the saved state says
+            they should be running but they are not
+        sequences: Custom sequences, each with its own command record, as a mapping
+            of name to list of steps - see `sequences.compile_sequences`
+        monitor_interval: Time between event loop lag samples - None to disable the
+            event loop monitor
+        slow_callback_duration: Event loop lag above which a sample counts as slow
+        log_slow_callbacks: Log each slow callback with its coroutine, using asyncio
+            debug mode - see `monitor.LoopMonitor`
     """
 
     prefix: str
@@ -30,6 +105,18 @@ class OdinProcServConfig:
     server_delay: Union[int, float]
     ioc_name: str
     ioc_delay: Union[int, float]
+    processes: List[Dict[str, Any]] = field(default_factory=list)
+    overrides: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    sequence_timeout: Optional[Union[int, float]] = DEFAULT_SEQUENCE_TIMEOUT
+    phase_timeout: Optional[Union[int, float]] = DEFAULT_PHASE_TIMEOUT
+    stop_timeout: Optional[Union[int, float]] = None
+    kill_timeout: Optional[Union[int, float]] = None
+    state_file: Optional[str] = None
+    restore_state: bool = False
+    sequences: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    monitor_interval: Optional[Union[int, float]] = DEFAULT_MONITOR_INTERVAL
+    slow_callback_duration: Union[int, float] = DEFAULT_SLOW_CALLBACK_DURATION
+    log_slow_callbacks: bool = False
 
 
 class OdinProcServControl:
@@ -47,11 +134,32 @@ class OdinProcServControl:
         self.config = config
         self._logger.debug("Config: %s", self.config)
 
-        processes = range(1, config.process_count + 1)
-        self.data_process_names = [
-            self._format_process_name(config.prefix, number) for number in processes
+        data_process_names = [
+            self._format_process_name(config.prefix, number)
+            for number in range(1, config.process_count + 1)
         ]
-        self.data_process_names.remove(config.server_process_name)
+        for spec in config.processes:
+            data_process_names.extend(expand_process_spec(spec))
+        self.targets = TargetRegistry.from_config(
+            data_process_names,
+            config.server_process_name,
+            config.ioc_name,
+            config.overrides,
+            defaults=dict(
+                stop_timeout=config.stop_timeout, kill_timeout=config.kill_timeout
+            ),
+        )
+        self.data_process_names = self.targets.role(DATA_ROLE)
+
+        self.state = (
+            load_state(config.state_file) if config.state_file else ControlState()
+        )
+        self.stop_timings: Dict[str, StopTiming] = {
+            name: timing
+            for name, timing in self.state.stop_timings.items()
+            if name in self.targets
+        }
+        self._logger.debug("State: %s", self.state)
         self._logger.debug(
             "OdinProcServ Targets:\nData processes: %s\nServer: %s\nIOC: %s",
             ", ".join(self.data_process_names),
@@ -63,12 +171,41 @@ class OdinProcServControl:
         self.start = builder.longOut("START", on_update=self.start_processes)
         self.stop = builder.longOut("STOP", on_update=self.stop_processes)
         self.restart = builder.longOut("RESTART", on_update=self.restart_processes)
+        self.status = builder.longStringIn(
+            "STATUS", initial_value="Idle", length=STATUS_LENGTH
+        )
+        self._command_lock: Optional[asyncio.Lock] = None
+        # The running command and the number of STOP or RESTART presses, which
+        # cancel the running command and any that were pressed before them
+        self._current: Optional[asyncio.Future] = None
+        self._preemptions = 0
+        self._preempted_by: Optional[str] = None
+
+        self.sequences = compile_sequences(
+            config.sequences,
+            self.targets,
+            reserved=RECORD_NAMES,
+            phase_timeout=config.phase_timeout,
+        )
+        self.sequence_records = {
+            name: builder.longOut(name, on_update=partial(self.run_sequence, name))
+            for name in self.sequences
+        }
+        self._logger.debug("Sequences: %s", ", ".join(self.sequences))
+
+        self.monitor: Optional[LoopMonitor] = None
+        if config.monitor_interval:
+            self.monitor = LoopMonitor(
+                config.monitor_interval,
+                config.slow_callback_duration,
+                config.log_slow_callbacks,
+                log_level,
+            )
 
     async def start_processes(self, value: int) -> None:
         """If button pressed, call _start and then release the button"""
         if value:
-            await self._start_processes()
-            self.start.set(0)
+            await self._run_sequence("START", self.start, self._start_processes)
 
     async def _start_processes(self) -> None:
         """Start processes in the correct order with appropriate delays
@@ -82,48 +219,70 @@ class OdinProcServControl:
 
         """
         self._logger.info("Start called")
-        await self._press_buttons(self.data_process_names, "START")
+        self.state.intended = RUNNING
+        await self._phase(
+            "start data processes",
+            self._press_buttons(self.data_process_names, "START"),
+        )
         self._logger.info("Started data processes")
 
         await asyncio.sleep(self.config.server_delay)
-        await self._press_buttons([self.config.server_process_name], "START")
+        await self._phase(
+            "start server",
+            self._press_buttons([self.config.server_process_name], "START"),
+        )
         self._logger.info("Started server")
 
         await asyncio.sleep(self.config.ioc_delay)
-        await self._press_buttons([self.config.ioc_name], "START")
+        await self._phase(
+            "start IOC", self._press_buttons([self.config.ioc_name], "START")
+        )
         self._logger.info("Started ADOdin IOC")
 
         # Stop will have toggled autorestart off - toggle it back on
-        await self._press_buttons(
-            self.data_process_names
-            + [self.config.server_process_name, self.config.ioc_name],
-            "TOGGLE",
+        await self._phase(
+            "enable autorestart", self._press_buttons(self.targets.names, "TOGGLE")
         )
+        self.state.autorestart = True
 
         self._logger.debug("Restart complete")
 
     async def stop_processes(self, value: int) -> None:
-        """If button pressed, call _stop and then release the button"""
+        """If button pressed, cancel any other command, call _stop and then release
+        the button"""
         if value:
-            await self._stop_processes()
-            self.stop.set(0)
+            await self._run_sequence(
+                "STOP", self.stop, self._stop_processes, preempt=True
+            )
 
     async def _stop_processes(self):
-        """Stop all processes"""
+        """Stop all processes
+
+        The logic is as follows:
+            - Press STOP on all processes
+            - For each process with a stop timeout, concurrently:
+                - Wait up to the stop timeout for it to exit
+                - If it has not exited and it has a kill timeout, press KILL and
+                  wait up to the kill timeout for it to exit
+
+        """
         self._logger.info("Stop called")
-        await self._press_buttons(
-            self.data_process_names
-            + [self.config.server_process_name, self.config.ioc_name],
-            "STOP",
+        self.state.intended = STOPPED
+        await self._phase(
+            "stop processes", self._press_buttons(self.targets.names, "STOP")
         )
+        self.state.autorestart = False
+        await self._confirm_stopped(self.targets.names)
 
         self._logger.debug("Stop complete")
 
     async def restart_processes(self, value: int) -> None:
-        """If button pressed, call _restart and then release the button"""
+        """If button pressed, cancel any other command, call _restart and then
+        release the button"""
         if value:
-            await self._restart_processes()
-            self.restart.set(0)
+            await self._run_sequence(
+                "RESTART", self.restart, self._restart_processes, preempt=True
+            )
 
     async def _restart_processes(self) -> None:
         """Restart processes by directly calling _stop and then _start"""
@@ -134,6 +293,405 @@ class OdinProcServControl:
 
         self._logger.debug("Restart complete")
 
+    async def run_sequence(self, name: str, value: int) -> None:
+        """If button pressed, run the named custom sequence and release the button"""
+        if value:
+            await self._run_sequence(
+                name,
+                self.sequence_records[name],
+                partial(self._run_steps, self.sequences[name]),
+            )
+
+    async def _run_steps(self, sequence: Sequence) -> None:
+        """Run each top level step of a custom sequence as a phase
+
+        A sleep or wait step is given a deadline of its own duration rather than the
+        phase timeout, so that a long sleep does not fail and a wait can fail with
+        its own error.
+
+        args:
+            sequence: The compiled sequence to run
+
+        """
+        self._logger.info("%s called", sequence.name)
+        for step in sequence.steps:
+            timeout = None
+            if isinstance(step, SleepStep):
+                # Allow for the loop waking up late
+                timeout = step.seconds + STEP_DEADLINE_MARGIN
+            elif isinstance(step, WaitStep):
+                # Allow for the final poll to complete
+                timeout = step.timeout + 2 * STOP_POLL_INTERVAL
+            await self._phase(step.description, step.run(self), timeout)
+
+        self._logger.debug("%s complete", sequence.name)
+
+    async def _confirm_stopped(self, names: List[str]) -> None:
+        """Escalate the stop of each given process concurrently and record timings
+
+        Processes without a stop timeout are not checked. Every escalation runs to
+        completion, even if another fails, so that one bad process does not stop the
+        others being killed. Raises RuntimeError listing every process that failed
+        or could not be confirmed to have exited. If this is cancelled, the
+        escalations are cancelled before returning.
+
+        args:
+            names: Names of the processes that STOP has been pressed on
+
+        """
+        targets = [
+            self.targets[name]
+            for name in names
+            if self.targets[name].stop_timeout is not None
+        ]
+        if not targets:
+            return
+
+        tasks = [asyncio.ensure_future(self._escalate_stop(t)) for t in targets]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            # Don't leave escalations to press KILL after the sequence ends
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        failed = []
+        for target, result in zip(targets, results):
+            if isinstance(result, BaseException):
+                self._logger.error("Could not stop %s: %s", target.name, result)
+                failed.append("{} ({})".format(target.name, result))
+            else:
+                self.stop_timings[target.name] = result
+                if not result.stopped:
+                    failed.append(target.name)
+        if failed:
+            raise RuntimeError("Did not exit: {}".format(", ".join(failed)))
+
+    async def _escalate_stop(self, target: ProcServTarget) -> StopTiming:
+        """Wait for a process to exit after STOP, escalating to KILL if it does not
+
+        args:
+            target: The process that STOP has been pressed on
+
+        """
+        assert target.stop_timeout is not None
+        start = time.monotonic()
+        stopped = await self._wait_for_exit(target.name, target.stop_timeout)
+        timing = StopTiming(stop=time.monotonic() - start, stopped=stopped)
+        if not stopped and target.kill_timeout is not None:
+            self._logger.warning(
+                "%s did not exit within %ss - killing",
+                target.name,
+                target.stop_timeout,
+            )
+            start = time.monotonic()
+            await self._press_buttons([target.name], KILL_SUFFIX)
+            timing.stopped = await self._wait_for_exit(target.name, target.kill_timeout)
+            timing.kill = time.monotonic() - start
+
+        if timing.stopped:
+            self._logger.info("%s stopped: %s", target.name, timing)
+        else:
+            self._logger.error("%s did not exit: %s", target.name, timing)
+        return timing
+
+    async def _wait_for_exit(self, name: str, timeout: Union[int, float]) -> bool:
+        """Poll the status of a process until it has exited or the timeout expires
+
+        args:
+            name: procServControl PV prefix of the process
+            timeout: Maximum time to wait
+
+        returns:
+            True if the process exited, else False
+
+        """
+        pv = "{}:{}".format(name, STATUS_SUFFIX)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if await caget(pv, timeout=STOP_POLL_INTERVAL) == STATUS_STOPPED:
+                    return True
+            except CANothing as e:
+                self._logger.debug("caget(%s) failed: %s", pv, e)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(STOP_POLL_INTERVAL, remaining))
+
+    async def _wait_for_status(
+        self, names: List[str], status: str, timeout: Union[int, float]
+    ) -> None:
+        """Poll the status of processes until they are all running or all stopped
+
+        Raises SequenceTimeoutError if they are not all in the status by the timeout.
+
+        args:
+            names: procServControl PV prefixes of the processes
+            status: `state.RUNNING` or `state.STOPPED`
+            timeout: Maximum time to wait
+
+        """
+        pvs = ["{}:{}".format(name, STATUS_SUFFIX) for name in names]
+        want_stopped = status == STOPPED
+        deadline = time.monotonic() + timeout
+        while True:
+            values = await caget(pvs, timeout=STOP_POLL_INTERVAL, throw=False)
+            pending = [
+                name
+                for name, value in zip(names, values)
+                if not value.ok or (value == STATUS_STOPPED) != want_stopped
+            ]
+            if not pending:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SequenceTimeoutError(
+                    "{} not {} after {}s".format(", ".join(pending), status, timeout)
+                )
+            await asyncio.sleep(min(STOP_POLL_INTERVAL, remaining))
+
+    async def _run_sequence(
+        self,
+        name: str,
+        record,
+        sequence: Callable[[], Awaitable[None]],
+        preempt: bool = False,
+    ) -> None:
+        """Run a sequence within the sequence timeout and then release the button
+
+        The button is always released, even if the sequence fails, times out or is
+        cancelled. The result is published on the STATUS record, which is put into
+        MAJOR alarm if the sequence did not complete.
+
+        Sequences are run one at a time in the order they were pressed, so
+        overlapping presses cannot interleave their caputs. A preempting sequence
+        instead cancels the running sequence and any waiting to run, so that e.g.
+        STOP is never stuck behind a START that hangs.
+
+        args:
+            name: Name of the sequence for logging and status - e.g. START
+            record: The button record that triggered the sequence
+            sequence: The sequence to run
+            preempt: Whether to cancel the running and waiting sequences
+
+        """
+        if self._command_lock is None:
+            # Created here so that it belongs to the dispatcher's event loop
+            self._command_lock = asyncio.Lock()
+        if preempt:
+            self._preemptions += 1
+            self._preempted_by = name
+            if self._current is not None:
+                self._current.cancel()
+        preemptions = self._preemptions
+
+        # Assume failure so that cancellation also leaves STATUS in alarm
+        severity, status = alarm.MAJOR_ALARM, alarm.STATE_ALARM
+        message = "{} cancelled".format(name)
+        try:
+            async with self._command_lock:
+                try:
+                    if self._preemptions != preemptions:
+                        # Pressed before a STOP or RESTART that is waiting to run
+                        message = "{} cancelled by {}".format(name, self._preempted_by)
+                        self._logger.warning(message)
+                        return
+
+                    self._set_status("{} running".format(name))
+                    start = time.monotonic()
+                    # Run as a task so that a preempting sequence can cancel it
+                    self._current = asyncio.ensure_future(
+                        self._with_timeout(sequence, self.config.sequence_timeout)
+                    )
+                    try:
+                        await self._current
+                    finally:
+                        self._current = None
+                except asyncio.CancelledError:
+                    if self._preemptions == preemptions:
+                        raise
+                    message = "{} cancelled by {}".format(name, self._preempted_by)
+                    self._logger.warning(message)
+                except asyncio.TimeoutError:
+                    status = alarm.TIMEOUT_ALARM
+                    message = "{} timed out after {}s".format(
+                        name, self.config.sequence_timeout
+                    )
+                    self._logger.error(message)
+                except SequenceTimeoutError as e:
+                    status = alarm.TIMEOUT_ALARM
+                    message = "{} failed: {}".format(name, e)
+                    self._logger.error(message)
+                except Exception as e:
+                    message = "{} failed: {}".format(name, e)
+                    self._logger.exception(message)
+                else:
+                    severity, status = alarm.NO_ALARM, alarm.NO_ALARM
+                    duration = time.monotonic() - start
+                    self.state.sequence_durations[name] = duration
+                    message = "{} complete in {:.1f}s".format(name, duration)
+                finally:
+                    self._set_status(message, severity, status)
+                    await self._save_state()
+        finally:
+            record.set(0)
+
+    @staticmethod
+    async def _with_timeout(
+        sequence: Callable[[], Awaitable[None]], timeout: Optional[float]
+    ) -> None:
+        # Only create the coroutine once running, in case of cancellation before
+        await asyncio.wait_for(sequence(), timeout)
+
+    def _set_status(
+        self, message: str, severity: int = alarm.NO_ALARM, status: int = alarm.NO_ALARM
+    ) -> None:
+        """Publish a message and alarm on the STATUS record, truncated to fit
+
+        args:
+            message: The message to publish
+            severity: Alarm severity - e.g. alarm.MAJOR_ALARM
+            status: Alarm status - e.g. alarm.TIMEOUT_ALARM
+
+        """
+        # Leave room for the null terminator
+        encoded = message.encode()[: STATUS_LENGTH - 1]
+        self.status.set(
+            encoded.decode(errors="ignore"), severity=severity, alarm=status
+        )
+
+    async def _save_state(self) -> None:
+        """Save the runtime state to the state file, if configured
+
+        The file is written in an executor, so that a slow disk does not block the
+        event loop.
+
+        """
+        if not self.config.state_file:
+            return
+        self.state.stop_timings = dict(self.stop_timings)
+        # Save a copy, as the state may be updated while the write is in progress
+        state = deepcopy(self.state)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, save_state, self.config.state_file, state)
+            self.state.updated = state.updated
+        except OSError as e:
+            self._logger.error(
+                "Could not save state to %s: %s", self.config.state_file, e
+            )
+
+    async def resync(self) -> None:
+        """Compare the running processes with the saved state
+
+        Reads the status of all processes in one batch, publishes a summary on the
+        STATUS record and, if `restore_state` is set, restarts the processes that
+        should be running but are not.
+
+        """
+        pvs = ["{}:{}".format(name, STATUS_SUFFIX) for name in self.targets.names]
+        values = await caget(pvs, timeout=STOP_POLL_INTERVAL, throw=False)
+        running, stopped, unreachable = [], [], []
+        for name, value in zip(self.targets.names, values):
+            if not value.ok:
+                unreachable.append(name)
+            elif value == STATUS_STOPPED:
+                stopped.append(name)
+            else:
+                running.append(name)
+        self._logger.info(
+            "Resync - intended: %s, running: %s, stopped: %s, unreachable: %s",
+            self.state.intended,
+            ", ".join(running),
+            ", ".join(stopped),
+            ", ".join(unreachable),
+        )
+
+        if self.state.intended == RUNNING and stopped:
+            self._logger.warning("Not running: %s", ", ".join(stopped))
+            if self.config.restore_state:
+                await self._run_sequence(
+                    "RESTORE", self.start, partial(self._restore_processes, stopped)
+                )
+                return
+        elif self.state.intended == STOPPED and running:
+            self._logger.warning("Running but intended stopped: %s", ", ".join(running))
+
+        self._set_status(
+            "Resync: {} running, {} stopped, {} unreachable".format(
+                len(running), len(stopped), len(unreachable)
+            )
+        )
+
+    async def _restore_processes(self, names: List[str]) -> None:
+        """Start only the given stopped processes, in the same order as START
+
+        Processes that are still running are left alone, so their autorestart is
+        not toggled. Autorestart is only toggled back on for the restarted processes
+        if it was last left enabled.
+
+        args:
+            names: Names of the stopped processes
+
+        """
+        self._logger.info("Restore called for %s", ", ".join(names))
+        data = [name for name in self.data_process_names if name in names]
+        started = False
+        if data:
+            await self._phase(
+                "start data processes", self._press_buttons(data, "START")
+            )
+            started = True
+
+        if self.config.server_process_name in names:
+            if started:
+                await asyncio.sleep(self.config.server_delay)
+            await self._phase(
+                "start server",
+                self._press_buttons([self.config.server_process_name], "START"),
+            )
+            started = True
+
+        if self.config.ioc_name in names:
+            if started:
+                await asyncio.sleep(self.config.ioc_delay)
+            await self._phase(
+                "start IOC", self._press_buttons([self.config.ioc_name], "START")
+            )
+
+        if self.state.autorestart:
+            await self._phase(
+                "enable autorestart", self._press_buttons(names, "TOGGLE")
+            )
+
+        self._logger.debug("Restore complete")
+
+    async def _phase(
+        self,
+        phase: str,
+        awaitable: Awaitable[None],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Await one phase of a sequence within the phase timeout
+
+        args:
+            phase: Description of the phase for logging - e.g. start server
+            awaitable: The phase to await
+            timeout: Deadline for this phase - None to use the phase timeout
+
+        """
+        if timeout is None:
+            timeout = self.config.phase_timeout
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise SequenceTimeoutError("{} timed out after {}s".format(phase, timeout))
+        self._logger.debug("%s took %.3fs", phase, time.monotonic() - start)
+
     async def _press_buttons(
         self, button_prefixes: list[str], button_suffix: str
     ) -> None:
@@ -152,18 +710,18 @@ class OdinProcServControl:
         await caput(buttons, 1)
         self._logger.debug("Caput complete")
 
-    @staticmethod
-    def _format_process_name(prefix: str, process_number: int) -> str:
-        """Format a valid DLS process name from a prefix and a number
+    async def _put(self, pv: str, value: Any) -> None:
+        """Put a value to a single PV
 
         args:
-            prefix: Process prefix including first three elements of the process name
-                e.g. BLXXY-EA-EIG1
-            process_number: The number of the process, i.e. the fourth element of the
-                process name. This will be padded to width 2, but can also be 3 digits
-                or more
+            pv: The PV to put to
+            value: The value to put
 
         """
-        if not prefix.endswith("-"):
-            prefix += "-"
-        return "{}{:02d}".format(prefix, process_number)
+        self._logger.debug("caput(%s, %s)", pv, value)
+        await caput(pv, value)
+
+    @staticmethod
+    def _format_process_name(prefix: str, process_number: int) -> str:
+        """Format a valid DLS process name - see `targets.format_process_name`"""
+        return format_process_name(prefix, process_number)
@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Collection,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .state import RUNNING, STOPPED
+from .targets import TargetRegistry
+
+if TYPE_CHECKING:
+    from .odinprocserv import OdinProcServControl
+
+__all__ = [
+    "SequenceConfigError",
+    "SequenceTimeoutError",
+    "Step",
+    "PressStep",
+    "PutStep",
+    "WaitStep",
+    "SleepStep",
+    "ParallelStep",
+    "GroupStep",
+    "Sequence",
+    "compile_sequences",
+]
+
+# Valid names for sequences, which are also used as record names
+SEQUENCE_NAME = re.compile(r"^[A-Z][A-Z0-9_]*$")
+# procServControl buttons that a press step may use
+BUTTONS = ("START", "STOP", "RESTART", "TOGGLE", "KILL")
+
+
+class SequenceConfigError(ValueError):
+    """Raised when a configured sequence is invalid"""
+
+
+class SequenceTimeoutError(Exception):
+    """Raised when a phase of a sequence does not complete within its deadline"""
+
+
+class Step(ABC):
+    """A single compiled step of a sequence"""
+
+    @property
+    @abstractmethod
+    def description(self) -> str:
+        """Description of the step for logging and errors"""
+
+    @abstractmethod
+    async def run(self, control: "OdinProcServControl") -> None:
+        """Run the step using the given control instance"""
+
+
+@dataclass(frozen=True)
+class PressStep(Step):
+    """Press a button on a set of targets
+
+    args:
+        names: Targets to press the button on
+        button: The button to press - e.g. START
+    """
+
+    names: List[str]
+    button: str
+
+    @property
+    def description(self) -> str:
+        return "press {} on {}".format(self.button, ", ".join(self.names))
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        await control._press_buttons(self.names, self.button)
+
+
+@dataclass(frozen=True)
+class PutStep(Step):
+    """Put a value to an arbitrary PV - e.g. to reconfigure a process
+
+    args:
+        pv: The PV to put to
+        value: The value to put
+    """
+
+    pv: str
+    value: Any
+
+    @property
+    def description(self) -> str:
+        return "put {} to {}".format(self.value, self.pv)
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        await control._put(self.pv, self.value)
+
+
+@dataclass(frozen=True)
+class WaitStep(Step):
+    """Wait until a set of targets are all running or all stopped
+
+    args:
+        names: Targets to wait for
+        status: `RUNNING` or `STOPPED`
+        timeout: Maximum time to wait before failing the sequence
+    """
+
+    names: List[str]
+    status: str
+    timeout: Union[int, float]
+
+    @property
+    def description(self) -> str:
+        return "wait for {} {}".format(", ".join(self.names), self.status)
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        await control._wait_for_status(self.names, self.status, self.timeout)
+
+
+@dataclass(frozen=True)
+class SleepStep(Step):
+    """Sleep for a fixed time
+
+    args:
+        seconds: Time to sleep for
+    """
+
+    seconds: Union[int, float]
+
+    @property
+    def description(self) -> str:
+        return "sleep {}s".format(self.seconds)
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        await asyncio.sleep(self.seconds)
+
+
+@dataclass(frozen=True)
+class ParallelStep(Step):
+    """Run steps concurrently, failing if any of them fail
+
+    args:
+        steps: The steps to run
+    """
+
+    steps: Tuple[Step, ...]
+
+    @property
+    def description(self) -> str:
+        return "parallel ({})".format("; ".join(s.description for s in self.steps))
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        tasks = [asyncio.ensure_future(step.run(control)) for step in self.steps]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Don't leave other branches pressing buttons after the sequence ends
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+@dataclass(frozen=True)
+class GroupStep(Step):
+    """Run steps one after another - e.g. as one branch of a `ParallelStep`
+
+    args:
+        steps: The steps to run
+    """
+
+    steps: Tuple[Step, ...]
+
+    @property
+    def description(self) -> str:
+        return "group ({})".format("; ".join(s.description for s in self.steps))
+
+    async def run(self, control: "OdinProcServControl") -> None:
+        for step in self.steps:
+            await step.run(control)
+
+
+@dataclass(frozen=True)
+class Sequence:
+    """A named, compiled sequence of steps
+
+    Each top level step is run as one phase, with its own phase deadline. A top
+    level sleep or wait step is instead given a deadline of its own duration.
+
+    args:
+        name: Name of the sequence and of its command record
+        steps: The top level steps
+    """
+
+    name: str
+    steps: Tuple[Step, ...]
+
+
+def _compile_step(
+    spec: Any,
+    targets: TargetRegistry,
+    phase_timeout: Optional[float] = None,
+    nested: bool = False,
+) -> Step:
+    if not isinstance(spec, dict) or len(spec) != 1:
+        raise SequenceConfigError(
+            "Step {} must be a mapping with exactly one key".format(spec)
+        )
+    ((kind, args),) = spec.items()
+
+    try:
+        if kind == "press":
+            button = str(args["button"])
+            if button not in BUTTONS:
+                raise SequenceConfigError(
+                    "Button must be one of {}, not {}".format(
+                        ", ".join(BUTTONS), button
+                    )
+                )
+            return PressStep(targets.select(args["targets"]), button)
+        elif kind == "put":
+            return PutStep(str(args["pv"]), args["value"])
+        elif kind == "wait":
+            status = args.get("status", RUNNING)
+            if status not in (RUNNING, STOPPED):
+                raise SequenceConfigError(
+                    "Wait status must be {} or {}, not {}".format(
+                        RUNNING, STOPPED, status
+                    )
+                )
+            timeout = float(args["timeout"])
+            if nested and phase_timeout is not None and timeout > phase_timeout:
+                raise SequenceConfigError(
+                    "Nested wait timeout {}s is longer than the phase timeout "
+                    "{}s".format(timeout, phase_timeout)
+                )
+            return WaitStep(targets.select(args["targets"]), status, timeout)
+        elif kind == "sleep":
+            seconds = float(args)
+            if nested and phase_timeout is not None and seconds > phase_timeout:
+                raise SequenceConfigError(
+                    "Nested sleep {}s is longer than the phase timeout {}s".format(
+                        seconds, phase_timeout
+                    )
+                )
+            return SleepStep(seconds)
+        elif kind in ("parallel", "group"):
+            if not isinstance(args, list) or not args:
+                raise SequenceConfigError(
+                    "{} must be a non-empty list of steps".format(kind)
+                )
+            # Nested steps all run within the phase deadline of the top level step
+            steps = tuple(
+                _compile_step(step, targets, phase_timeout, nested=True)
+                for step in args
+            )
+            step = ParallelStep(steps) if kind == "parallel" else GroupStep(steps)
+            duration = _max_duration(step)
+            if phase_timeout is not None and duration > phase_timeout:
+                raise SequenceConfigError(
+                    "Sleeps and waits in {} can take {}s, longer than the phase "
+                    "timeout {}s".format(step.description, duration, phase_timeout)
+                )
+            return step
+    except SequenceConfigError:
+        raise
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise SequenceConfigError("Invalid {} step {}: {!r}".format(kind, args, e))
+
+    raise SequenceConfigError("Unknown step type {}".format(kind))
+
+
+def _max_duration(step: Step) -> float:
+    """Longest time the sleeps and waits of a step can take"""
+    if isinstance(step, SleepStep):
+        return step.seconds
+    elif isinstance(step, WaitStep):
+        return step.timeout
+    elif isinstance(step, GroupStep):
+        return sum(_max_duration(s) for s in step.steps)
+    elif isinstance(step, ParallelStep):
+        return max(_max_duration(s) for s in step.steps)
+    return 0
+
+
+def compile_sequences(
+    config: Dict[str, List[Dict[str, Any]]],
+    targets: TargetRegistry,
+    reserved: Collection[str] = (),
+    phase_timeout: Optional[float] = None,
+) -> Dict[str, Sequence]:
+    """Compile sequences from config into executable plans
+
+    Target selectors are resolved against the registry here, so that running a
+    sequence does no lookups and any config errors are raised at load time.
+
+    Each sequence is a list of steps, each a mapping with one of these keys:
+        - ``press: {targets: <selector>, button: <button>}``
+        - ``put: {pv: <pv>, value: <value>}``
+        - ``wait: {targets: <selector>, status: running|stopped, timeout: <s>}``
+        - ``sleep: <s>``
+        - ``parallel: [<step>, ...]``
+        - ``group: [<step>, ...]``
+
+    A selector is anything accepted by `TargetRegistry.select` and a button is one
+    of `BUTTONS`. A top level sleep or wait has a deadline of its own duration.
+    Parallel and group steps run within the phase deadline, so the sleeps and waits
+    in them may not take longer than `phase_timeout` in total.
+
+    args:
+        config: Mapping of sequence name to list of steps
+        targets: Registry to resolve target selectors with
+        reserved: Names that sequences may not use - e.g. existing record names
+        phase_timeout: Deadline of each top level step - None to not check waits
+
+    """
+    sequences = {}
+    for name, steps in config.items():
+        if not SEQUENCE_NAME.match(name):
+            raise SequenceConfigError(
+                "Sequence name {} must be upper case letters, digits and _".format(name)
+            )
+        if name in reserved:
+            raise SequenceConfigError("Sequence name {} is reserved".format(name))
+        if not isinstance(steps, list) or not steps:
+            raise SequenceConfigError(
+                "Sequence {} must be a non-empty list of steps".format(name)
+            )
+        sequences[name] = Sequence(
+            name, tuple(_compile_step(step, targets, phase_timeout) for step in steps)
+        )
+
+    return sequences
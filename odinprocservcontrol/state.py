@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, Optional, Tuple
+
+__all__ = [
+    "RUNNING",
+    "STOPPED",
+    "UNKNOWN",
+    "StopTiming",
+    "ControlState",
+    "load_state",
+    "save_state",
+]
+
+RUNNING = "running"
+STOPPED = "stopped"
+UNKNOWN = "unknown"
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StopTiming:
+    """Time taken by each step of stopping a single process
+
+    args:
+        stop: Seconds from STOP until exit was confirmed or the stop timeout expired
+        kill: Seconds from KILL until exit was confirmed or the kill timeout expired
+            - None if KILL was not pressed
+        stopped: Whether the process was confirmed to have exited
+    """
+
+    stop: float
+    kill: Optional[float] = None
+    stopped: bool = True
+
+
+@dataclass
+class ControlState:
+    """Runtime state of OdinProcServControl that should survive a restart
+
+    Only `intended` and `autorestart` are acted on at startup. The timings are kept
+    for diagnosis and do not change any timeouts.
+
+    args:
+        intended: What the processes were last asked to do - `RUNNING`, `STOPPED` or
+            `UNKNOWN` if no sequence has been run
+        autorestart: Whether autorestart was last left enabled, if known
+        stop_timings: Last `StopTiming` of each process
+        sequence_durations: Duration in seconds of the last successful run of each
+            sequence - e.g. {"START": 8.1}
+        updated: Unix time the state was last saved
+    """
+
+    intended: str = UNKNOWN
+    autorestart: Optional[bool] = None
+    stop_timings: Dict[str, StopTiming] = field(default_factory=dict)
+    sequence_durations: Dict[str, float] = field(default_factory=dict)
+    updated: Optional[float] = None
+
+
+def load_state(path: str) -> ControlState:
+    """Load state saved by `save_state`
+
+    A missing or unreadable file gives a default state, and any field with an
+    invalid value falls back to its default, so that a bad state file never stops
+    the IOC starting.
+
+    args:
+        path: Path of the state file
+
+    """
+    try:
+        with open(path) as state_file:
+            values = json.load(state_file)
+    except FileNotFoundError:
+        _logger.info("No state file at %s - starting with default state", path)
+        return ControlState()
+    except (OSError, ValueError) as e:
+        _logger.warning("Could not load state from %s: %s", path, e)
+        return ControlState()
+
+    if not isinstance(values, dict):
+        _logger.warning("Ignoring invalid state in %s", path)
+        return ControlState()
+
+    state = ControlState()
+    # Ignore unknown keys so that older versions can read newer files
+    for name, parse in _PARSERS.items():
+        if name not in values:
+            continue
+        try:
+            setattr(state, name, parse(values[name]))
+        except (TypeError, ValueError) as e:
+            _logger.warning("Ignoring invalid %s in %s: %s", name, path, e)
+    return state
+
+
+def _check_type(value: Any, types: Tuple[type, ...], description: str) -> Any:
+    # bool is an int, but is never a valid number here
+    if isinstance(value, bool) and bool not in types:
+        raise TypeError("{} must not be a bool".format(description))
+    if not isinstance(value, types):
+        raise TypeError(
+            "{} must be {}, not {}".format(
+                description,
+                " or ".join(t.__name__ for t in types),
+                type(value).__name__,
+            )
+        )
+    return value
+
+
+def _parse_intended(value: Any) -> str:
+    if value not in (RUNNING, STOPPED, UNKNOWN):
+        raise ValueError(
+            "{!r} is not one of {}, {} or {}".format(value, RUNNING, STOPPED, UNKNOWN)
+        )
+    return value
+
+
+def _parse_autorestart(value: Any) -> Optional[bool]:
+    return _check_type(value, (bool, type(None)), "autorestart")
+
+
+def _parse_stop_timings(value: Any) -> Dict[str, StopTiming]:
+    _check_type(value, (dict,), "stop_timings")
+    known = {f.name for f in fields(StopTiming)}
+    timings = {}
+    for name, timing in value.items():
+        _check_type(timing, (dict,), name)
+        # Ignore unknown keys, as for the top level
+        timing = {k: v for k, v in timing.items() if k in known}
+        _check_type(timing.get("stop"), (int, float), name + " stop")
+        _check_type(timing.get("kill"), (int, float, type(None)), name + " kill")
+        _check_type(timing.get("stopped", True), (bool,), name + " stopped")
+        timings[name] = StopTiming(**timing)
+    return timings
+
+
+def _parse_sequence_durations(value: Any) -> Dict[str, float]:
+    _check_type(value, (dict,), "sequence_durations")
+    for name, duration in value.items():
+        _check_type(duration, (int, float), name)
+    return value
+
+
+def _parse_updated(value: Any) -> Optional[float]:
+    return _check_type(value, (int, float, type(None)), "updated")
+
+
+_PARSERS = {
+    "intended": _parse_intended,
+    "autorestart": _parse_autorestart,
+    "stop_timings": _parse_stop_timings,
+    "sequence_durations": _parse_sequence_durations,
+    "updated": _parse_updated,
+}
+
+
+def save_state(path: str, state: ControlState) -> None:
+    """Atomically save state to a file
+
+    The state is written to a temporary file in the same directory and then moved
+    over the old file, so the file is never left partially written.
+
+    args:
+        path: Path of the state file
+        state: The state to save
+
+    """
+    state.updated = time.time()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=".{}.".format(os.path.basename(path)), dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(asdict(state), tmp_file, indent=2, sort_keys=True)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, fields, replace
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+__all__ = [
+    "DATA_ROLE",
+    "SERVER_ROLE",
+    "IOC_ROLE",
+    "TargetConfigError",
+    "ProcServTarget",
+    "TargetRegistry",
+    "format_process_name",
+]
+
+DATA_ROLE = "data"
+SERVER_ROLE = "server"
+IOC_ROLE = "ioc"
+ROLES = (DATA_ROLE, SERVER_ROLE, IOC_ROLE)
+
+
+class TargetConfigError(ValueError):
+    """Raised when the configured procServ targets are invalid"""
+
+
+@dataclass(frozen=True)
+class ProcServTarget:
+    """A procServControl instance to be controlled
+
+    args:
+        name: procServControl PV prefix - e.g. BLXXY-EA-ODN-01
+        role: One of `DATA_ROLE`, `SERVER_ROLE` or `IOC_ROLE`
+        host: Optional host the process runs on, for grouping and lookup
+        stop_timeout: Time to wait for the process to exit after STOP before
+            escalating - None to not wait for confirmation
+        kill_timeout: Time to wait for the process to exit after KILL - None to not
+            kill the process
+    """
+
+    name: str
+    role: str = DATA_ROLE
+    host: Optional[str] = None
+    stop_timeout: Optional[Union[int, float]] = None
+    kill_timeout: Optional[Union[int, float]] = None
+
+
+# Fields of ProcServTarget that may be set by an override. The role is fixed by
+# the config, as the server and IOC are also started by name.
+OVERRIDE_FIELDS = frozenset(f.name for f in fields(ProcServTarget)) - {"name", "role"}
+
+
+def format_process_name(prefix: str, process_number: int) -> str:
+    """Format a valid DLS process name from a prefix and a number
+
+    args:
+        prefix: Process prefix including first three elements of the process name
+            e.g. BLXXY-EA-EIG1
+        process_number: The number of the process, i.e. the fourth element of the
+            process name. This will be padded to width 2, but can also be 3 digits
+            or more
+
+    """
+    if not prefix.endswith("-"):
+        prefix += "-"
+    return "{}{:02d}".format(prefix, process_number)
+
+
+def expand_process_spec(spec: Dict[str, Any]) -> List[str]:
+    """Expand a single entry of the `processes` config into process names
+
+    Supported forms:
+        - ``{"names": [A, B, ...]}``: An explicit list of names
+        - ``{"prefix": P, "range": [first, last]}``: Numbered names from first to
+          last inclusive, formatted with `format_process_name`
+        - ``{"prefix": P, "numbers": [1, 3, 7]}``: Non-contiguous numbered names
+
+    args:
+        spec: The config entry to expand
+
+    """
+    if "names" in spec:
+        names = spec["names"]
+        if isinstance(names, str):
+            names = [names]
+        return [str(name) for name in names]
+
+    if "prefix" not in spec:
+        raise TargetConfigError(
+            "Process entry {} must give either `names` or `prefix`".format(spec)
+        )
+    if "range" in spec:
+        try:
+            first, last = spec["range"]
+        except (TypeError, ValueError):
+            raise TargetConfigError(
+                "Process range {} must be [first, last]".format(spec["range"])
+            )
+        numbers: Iterable[int] = range(int(first), int(last) + 1)
+    elif "numbers" in spec:
+        numbers = [int(number) for number in spec["numbers"]]
+    else:
+        raise TargetConfigError(
+            "Process entry {} must give either `range` or `numbers`".format(spec)
+        )
+
+    return [format_process_name(spec["prefix"], number) for number in numbers]
+
+
+def _check_fields(source: str, values: Dict[str, Any]) -> None:
+    invalid = set(values) - OVERRIDE_FIELDS
+    if invalid:
+        raise TargetConfigError(
+            "Invalid target fields for {}: {}".format(
+                source, ", ".join(sorted(invalid))
+            )
+        )
+
+
+def _check_values(target: ProcServTarget) -> None:
+    if target.host is not None and not isinstance(target.host, str):
+        raise TargetConfigError(
+            "Target {} host must be a string, not {!r}".format(target.name, target.host)
+        )
+    for name in ("stop_timeout", "kill_timeout"):
+        value = getattr(target, name)
+        if value is None:
+            continue
+        # bool is an int, but is never a valid timeout
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise TargetConfigError(
+                "Target {} {} must be a non-negative number, not {!r}".format(
+                    target.name, name, value
+                )
+            )
+
+
+class TargetRegistry:
+    """Validated set of procServ targets indexed by name, role and host
+
+    Built once at config load so that operations can look up targets and the name
+    lists they need without regenerating them.
+
+    args:
+        targets: Targets in the order operations should address them
+    """
+
+    def __init__(self, targets: Iterable[ProcServTarget]) -> None:
+        self._by_name: Dict[str, ProcServTarget] = {}
+        self._by_role: Dict[str, List[str]] = {role: [] for role in ROLES}
+        self._by_host: Dict[Optional[str], List[str]] = {}
+
+        for target in targets:
+            if not target.name:
+                raise TargetConfigError("Target names must not be empty")
+            if target.name in self._by_name:
+                raise TargetConfigError("Duplicate target {}".format(target.name))
+            if target.role not in ROLES:
+                raise TargetConfigError(
+                    "Target {} has invalid role {} - must be one of {}".format(
+                        target.name, target.role, ", ".join(ROLES)
+                    )
+                )
+            _check_values(target)
+            self._by_name[target.name] = target
+            self._by_role[target.role].append(target.name)
+            self._by_host.setdefault(target.host, []).append(target.name)
+
+        for role in (SERVER_ROLE, IOC_ROLE):
+            if len(self._by_role[role]) != 1:
+                raise TargetConfigError(
+                    "Exactly one {} target required, got {}".format(
+                        role, self._by_role[role]
+                    )
+                )
+
+        # Ordered as operations address them: data processes, server, IOC
+        self.names: List[str] = (
+            self._by_role[DATA_ROLE]
+            + self._by_role[SERVER_ROLE]
+            + self._by_role[IOC_ROLE]
+        )
+
+    @classmethod
+    def from_config(
+        cls,
+        data_process_names: Iterable[str],
+        server_process_name: str,
+        ioc_name: str,
+        overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+        defaults: Optional[Dict[str, Any]] = None,
+    ) -> "TargetRegistry":
+        """Create a registry from process names and per-target overrides
+
+        args:
+            data_process_names: Names of all data processes. The server and IOC are
+                dropped from this if present.
+            server_process_name: Name of odin server process
+            ioc_name: Name of ADOdin IOC
+            overrides: Mapping of name or glob pattern to `ProcServTarget` fields to
+                set on every matching target - e.g. {"BLXXY-EA-ODN-1*": {"host": "a"}}
+            defaults: `ProcServTarget` fields to set on all targets before overrides
+
+        """
+        defaults = defaults or {}
+        _check_fields("defaults", defaults)
+        targets = [
+            ProcServTarget(name, DATA_ROLE, **defaults)
+            for name in data_process_names
+            if name not in (server_process_name, ioc_name)
+        ]
+        targets.append(ProcServTarget(server_process_name, SERVER_ROLE, **defaults))
+        targets.append(ProcServTarget(ioc_name, IOC_ROLE, **defaults))
+
+        for pattern, values in (overrides or {}).items():
+            _check_fields(pattern, values)
+            matched = False
+            for idx, target in enumerate(targets):
+                if fnmatchcase(target.name, pattern):
+                    targets[idx] = replace(target, **values)
+                    matched = True
+            if not matched:
+                raise TargetConfigError(
+                    "Override {} does not match any target".format(pattern)
+                )
+
+        return cls(targets)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._by_name
+
+    def __getitem__(self, name: str) -> ProcServTarget:
+        return self._by_name[name]
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def role(self, role: str) -> List[str]:
+        """Names of all targets with the given role"""
+        return self._by_role[role]
+
+    def host(self, host: Optional[str]) -> List[str]:
+        """Names of all targets on the given host"""
+        return self._by_host.get(host, [])
+
+    def match(self, pattern: str) -> List[str]:
+        """Names of all targets matching the given glob pattern"""
+        return [name for name in self.names if fnmatchcase(name, pattern)]
+
+    def select(self, selector: Any) -> List[str]:
+        """Resolve a target selector to a list of names
+
+        A selector may be a role, a target name, a glob pattern, ``host:<host>`` or a
+        list of any of these. Raises `TargetConfigError` if nothing matches.
+
+        args:
+            selector: The selector to resolve
+
+        """
+        if isinstance(selector, (list, tuple)):
+            names: List[str] = []
+            for item in selector:
+                names.extend(n for n in self.select(item) if n not in names)
+            return names
+
+        selector = str(selector)
+        if selector in self._by_role:
+            names = self._by_role[selector]
+        elif selector in self._by_name:
+            names = [selector]
+        elif selector.startswith("host:"):
+            names = self.host(selector[len("host:") :])
+        else:
+            names = self.match(selector)
+
+        if not names:
+            raise TargetConfigError("No targets match {}".format(selector))
+        return list(names)
@@ -0,0 +1,397 @@
+"""
+Stress test of OdinProcServControl against a simulated procServControl backend.
+
+Randomised START, STOP, RESTART and custom sequence presses are fired concurrently,
+along with simulated process crashes and resyncs that restore them. One process
+ignores STOP and has its own stop timeout, so every stop escalates to KILL. Event
+loop lag, command latency and memory growth are measured. Afterwards every button
+must have been released, the only alarms must be for preempted commands and all
+targets must be in the state the last command asked for.
+
+The soak measures wall-clock timings, so it only runs when ODINPROCSERV_SOAK_SECONDS
+is set to how long it should run for:
+
+    ODINPROCSERV_SOAK_SECONDS=600 pytest -s tests/test_load.py
+"""
+
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+from typing import Collection, Dict, List, Optional, Set
+
+import pytest
+from mock import patch
+from pytest_mock import MockerFixture
+
+from odinprocservcontrol import OdinProcServConfig, OdinProcServControl
+from odinprocservcontrol.odinprocserv import alarm, builder
+
+ODINPROCSERV_PATCH = "odinprocservcontrol.odinprocserv"
+SOAK_SECONDS = float(os.environ.get("ODINPROCSERV_SOAK_SECONDS", 0))
+# A process that ignores STOP, so stopping it always needs KILL
+STUBBORN = "BLXXY-EA-ODN-05"
+# Simulated CA round trip and time for a process to react to a button
+CA_LATENCY = 0.002
+PROCESS_LATENCY = 0.01
+# Limits that a healthy controller should stay well within
+MAX_LOOP_LAG = 0.25
+MAX_LATENCY = 5
+MAX_MEMORY_GROWTH = 512 * 1024
+
+
+class _Status(int):
+    """Stand-in for an aioca augmented int value"""
+
+    ok = True
+
+
+class SimulatedProcServ:
+    """Simulated procServControl instances for a set of targets
+
+    Buttons take effect after a random delay, as a real process takes time to start
+    and exit. Provides async caput and caget with the same calling convention as
+    aioca.
+
+    args:
+        names: Names of the targets
+        ignore_stop: Targets that only exit when killed
+        ignore_kill: Targets that never exit
+        kill_fails: Targets whose KILL caput raises an exception
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        ignore_stop: Collection[str] = (),
+        ignore_kill: Collection[str] = (),
+        kill_fails: Collection[str] = (),
+    ) -> None:
+        self.running: Dict[str, bool] = {name: False for name in names}
+        self.autorestart: Dict[str, bool] = {name: False for name in names}
+        self.pending: Dict[str, asyncio.TimerHandle] = {}
+        self.ignore_stop = set(ignore_stop) | set(ignore_kill)
+        self.ignore_kill = set(ignore_kill)
+        self.kill_fails = set(kill_fails)
+        self.puts = 0
+        self.kills: List[str] = []
+
+    async def caput(self, pvs, value, **kwargs):
+        await asyncio.sleep(random.uniform(0, CA_LATENCY))
+        for pv in [pvs] if isinstance(pvs, str) else pvs:
+            self.puts += 1
+            name, button = pv.rsplit(":", 1)
+            if button == "STOP" and name not in self.ignore_stop:
+                self._later(name, False)
+            elif button == "KILL":
+                if name in self.kill_fails:
+                    raise RuntimeError("caput {} failed".format(pv))
+                self.kills.append(name)
+                if name not in self.ignore_kill:
+                    self._later(name, False)
+            elif button in ("START", "RESTART"):
+                self._later(name, True)
+            elif button == "TOGGLE":
+                self.autorestart[name] = not self.autorestart[name]
+
+    async def caget(self, pvs, **kwargs):
+        await asyncio.sleep(random.uniform(0, CA_LATENCY))
+        if isinstance(pvs, str):
+            return _Status(self.running[pvs.rsplit(":", 1)[0]])
+        return [_Status(self.running[pv.rsplit(":", 1)[0]]) for pv in pvs]
+
+    def crash(self, name: str) -> None:
+        """Make a process exit and stay down, which needs autorestart to be off"""
+        if name in self.pending:
+            self.pending.pop(name).cancel()
+        self.running[name] = False
+        self.autorestart[name] = False
+
+    def _later(self, name: str, running: bool) -> None:
+        # procServ handles commands in order, so a new one supersedes a pending one
+        if name in self.pending:
+            self.pending[name].cancel()
+
+        def set_running():
+            self.running[name] = running
+            del self.pending[name]
+
+        loop = asyncio.get_event_loop()
+        self.pending[name] = loop.call_later(
+            random.uniform(0, PROCESS_LATENCY), set_running
+        )
+
+
+class FakeRecord:
+    """Minimal softioc record that counts sets without keeping call history"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.value = None
+        self.sets = 0
+        # Each distinct value that was set in alarm
+        self.alarms: Set[str] = set()
+
+    def set(self, value, **kwargs) -> None:
+        self.value = value
+        self.sets += 1
+        if kwargs.get("severity", alarm.NO_ALARM) != alarm.NO_ALARM:
+            self.alarms.add(value)
+
+
+class LoopLagProbe:
+    """Measure how late the event loop wakes a task that sleeps for `interval`"""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags: List[float] = []
+
+    async def run(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.monotonic() - start - self.interval)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def memory_growth(
+    baseline: Optional[tracemalloc.Snapshot], current: tracemalloc.Snapshot
+) -> int:
+    """Bytes allocated since the baseline, excluding this harness's own statistics"""
+    if baseline is None:
+        return 0
+    exclude = [tracemalloc.Filter(False, __file__)]
+    return sum(
+        stat.size_diff
+        for stat in current.filter_traces(exclude).compare_to(
+            baseline.filter_traces(exclude), "filename"
+        )
+    )
+
+
+@pytest.fixture(autouse=True)
+def _patch_builder(mocker: MockerFixture):
+    # Mocks would keep every call, which would show up as memory growth
+    mocker.patch.object(builder, "longOut", FakeRecord)
+    mocker.patch.object(builder, "longStringIn", FakeRecord)
+    mocker.patch.object(builder, "aIn", FakeRecord)
+    mocker.patch.object(builder, "longIn", FakeRecord)
+
+
+@pytest.fixture(autouse=True)
+def _fast_timings():
+    with patch(ODINPROCSERV_PATCH + ".RESTART_DELAY", 0.01), patch(
+        ODINPROCSERV_PATCH + ".STOP_POLL_INTERVAL", 0.005
+    ):
+        yield
+
+
+@pytest.fixture
+def control() -> OdinProcServControl:
+    config = OdinProcServConfig(
+        prefix="BLXXY-EA-ODN",
+        process_count=11,
+        server_process_name="BLXXY-EA-ODN-01",
+        server_delay=0.01,
+        ioc_name="BLXXY-EA-IOC-01",
+        ioc_delay=0.01,
+        stop_timeout=1,
+        kill_timeout=1,
+        overrides={STUBBORN: {"stop_timeout": 0.05}},
+        restore_state=True,
+        sequences={
+            "RESTART_SERVER": [
+                {"press": {"targets": "server", "button": "STOP"}},
+                {"wait": {"targets": "server", "status": "stopped", "timeout": 1}},
+                {"press": {"targets": "server", "button": "START"}},
+            ]
+        },
+    )
+    return OdinProcServControl(config, log_level="WARNING")
+
+
+@pytest.mark.asyncio
+async def test_failed_stop(control: OdinProcServControl) -> None:
+    # One process never exits. Another's KILL caput fails while a third is still
+    # waiting to be killed, which must still be killed.
+    slow = "BLXXY-EA-ODN-03"
+    control.targets = control.targets.from_config(
+        control.targets.role("data"),
+        control.config.server_process_name,
+        control.config.ioc_name,
+        overrides={
+            "BLXXY-EA-ODN-02": {"stop_timeout": 0.01, "kill_timeout": 0.01},
+            STUBBORN: {"stop_timeout": 0.02},
+            slow: {"stop_timeout": 0.2},
+        },
+        defaults=dict(stop_timeout=0.05, kill_timeout=0.05),
+    )
+    backend = SimulatedProcServ(
+        control.targets.names,
+        ignore_stop=[slow, STUBBORN],
+        ignore_kill=["BLXXY-EA-ODN-02"],
+        kill_fails=[STUBBORN],
+    )
+
+    with patch(ODINPROCSERV_PATCH + ".caput", backend.caput), patch(
+        ODINPROCSERV_PATCH + ".caget", backend.caget
+    ):
+        await control.start_processes(1)
+        await asyncio.wait_for(control.stop_processes(1), 1)
+        assert control.stop.value == 0
+        assert control.status.value == (
+            "STOP failed: Did not exit: BLXXY-EA-ODN-02, "
+            "{0} (caput {0}:KILL failed)".format(STUBBORN)
+        )
+        assert control.status.value in control.status.alarms
+
+        # The failure of one process did not stop the others being killed
+        await asyncio.sleep(PROCESS_LATENCY * 2)
+        assert slow in backend.kills
+        assert not backend.running[slow]
+        kills = len(backend.kills)
+        # No escalation outlives the STOP command
+        await asyncio.sleep(0.1)
+        assert len(backend.kills) == kills
+
+        # The controller is not left stuck and the next command runs normally
+        await control.start_processes(1)
+        await asyncio.sleep(PROCESS_LATENCY * 2)
+
+    assert control.status.value.startswith("START complete")
+    assert all(backend.running.values())
+
+
+@pytest.mark.asyncio
+async def test_resync_restores_crashed(control: OdinProcServControl) -> None:
+    backend = SimulatedProcServ(control.targets.names)
+
+    with patch(ODINPROCSERV_PATCH + ".caput", backend.caput), patch(
+        ODINPROCSERV_PATCH + ".caget", backend.caget
+    ):
+        await control.start_processes(1)
+        await asyncio.sleep(PROCESS_LATENCY * 2)
+        backend.crash("BLXXY-EA-ODN-02")
+        backend.crash(control.config.ioc_name)
+
+        await control.resync()
+        await asyncio.sleep(PROCESS_LATENCY * 2)
+
+    assert control.start.value == 0
+    assert control.status.value.startswith("RESTORE complete")
+    assert all(backend.running.values())
+    # Autorestart was only toggled back on for the restored processes
+    assert all(backend.autorestart.values())
+
+
+@pytest.mark.skipif(not SOAK_SECONDS, reason="ODINPROCSERV_SOAK_SECONDS not set")
+@pytest.mark.asyncio
+async def test_concurrent_commands(control: OdinProcServControl) -> None:
+    backend = SimulatedProcServ(control.targets.names, ignore_stop=[STUBBORN])
+    probe = LoopLagProbe()
+    commands = {
+        "START": (control.start_processes, control.start),
+        "STOP": (control.stop_processes, control.stop),
+        "RESTART": (control.restart_processes, control.restart),
+        "RESTART_SERVER": (
+            lambda value: control.run_sequence("RESTART_SERVER", value),
+            control.sequence_records["RESTART_SERVER"],
+        ),
+        # Resync restores processes that have crashed, using the START record
+        "RESYNC": (lambda value: control.resync(), None),
+    }
+    latencies: Dict[str, List[float]] = {name: [] for name in commands}
+    latched: Dict[str, asyncio.Future] = {}
+
+    def press(name: str) -> asyncio.Future:
+        # A button only processes again once it has been released
+        if name not in latched:
+            latched[name] = asyncio.ensure_future(handle(name))
+        return latched[name]
+
+    async def handle(name: str) -> None:
+        handler, _ = commands[name]
+        start = time.monotonic()
+        try:
+            await handler(1)
+        finally:
+            latencies[name].append(time.monotonic() - start)
+            del latched[name]
+
+    with patch(ODINPROCSERV_PATCH + ".caput", backend.caput), patch(
+        ODINPROCSERV_PATCH + ".caget", backend.caget
+    ):
+        probe_task = asyncio.ensure_future(probe.run())
+        tracemalloc.start()
+        last = None
+        baseline: Optional[tracemalloc.Snapshot] = None
+        deadline = time.monotonic() + SOAK_SECONDS
+        try:
+            while time.monotonic() < deadline:
+                # Fire a burst of overlapping presses, then let some of them finish
+                for _ in range(random.randint(1, 4)):
+                    press(random.choice(list(commands)))
+                if random.random() < 0.1:
+                    backend.crash(random.choice(control.targets.names))
+                await asyncio.sleep(random.uniform(0, 0.05))
+                # Measure growth from half way, once everything has warmed up
+                if baseline is None and time.monotonic() > deadline - SOAK_SECONDS / 2:
+                    baseline = tracemalloc.take_snapshot()
+
+            # Finish with a known command once everything else is released, so the
+            # final state is deterministic
+            await asyncio.gather(*latched.values())
+            last = random.choice(["START", "STOP", "RESTART"])
+            await press(last)
+            # Let the simulated processes react to the last buttons
+            await asyncio.sleep(PROCESS_LATENCY * 2)
+            growth = memory_growth(baseline, tracemalloc.take_snapshot())
+        finally:
+            tracemalloc.stop()
+            probe_task.cancel()
+
+    total = sum(len(values) for values in latencies.values())
+    print(
+        "\n{} commands, {} caputs in {:.1f}s".format(total, backend.puts, SOAK_SECONDS)
+    )
+    for name, values in latencies.items():
+        if values:
+            print(
+                "{:>15}: n={:<5} p50={:.3f}s p95={:.3f}s p99={:.3f}s".format(
+                    name,
+                    len(values),
+                    percentile(values, 0.5),
+                    percentile(values, 0.95),
+                    percentile(values, 0.99),
+                )
+            )
+    print(
+        "Loop lag: p50={:.4f}s p99={:.4f}s max={:.4f}s, memory growth: {}B".format(
+            percentile(probe.lags, 0.5),
+            percentile(probe.lags, 0.99),
+            max(probe.lags),
+            growth,
+        )
+    )
+
+    # Every button must have been released, at least once per press
+    for name, (_, record) in commands.items():
+        if record is not None:
+            assert record.value == 0
+            assert record.sets >= len(latencies[name])
+    # Commands may only fail by being preempted by STOP or RESTART
+    assert all(" cancelled by " in message for message in control.status.alarms)
+    # Stopping the stubborn process escalated to KILL
+    assert STUBBORN in backend.kills
+
+    # All targets must end up in the state the last command asked for
+    expected = last != "STOP"
+    assert backend.running == {name: expected for name in control.targets.names}
+
+    assert max(probe.lags) < MAX_LOOP_LAG
+    assert max(max(values) for values in latencies.values()) < MAX_LATENCY
+    assert growth < MAX_MEMORY_GROWTH
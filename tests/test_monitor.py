@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+from mock import Mock
+from pytest_mock import MockerFixture
+
+from odinprocservcontrol.monitor import LoopMonitor, builder
+
+
+@pytest.fixture(autouse=True)
+def _patch_builder(mocker: MockerFixture):
+    mocker.patch.object(builder, "aIn", side_effect=lambda *args, **kwargs: Mock())
+    mocker.patch.object(builder, "longIn", side_effect=lambda *args, **kwargs: Mock())
+
+
+@pytest.fixture
+def monitor() -> LoopMonitor:
+    return LoopMonitor(
+        interval=0.01,
+        slow_callback_duration=0.05,
+        log_slow_callbacks=False,
+        log_level="DEBUG",
+    )
+
+
+@pytest.mark.asyncio
+async def test_sample(monitor: LoopMonitor) -> None:
+    lag = await monitor.sample(asyncio.get_running_loop())
+
+    assert lag < 0.05
+    monitor.lag.set.assert_called_once_with(lag)
+    monitor.lag_max.set.assert_called_once_with(lag)
+    monitor.pending_tasks.set.assert_called_once()
+    monitor.slow_sample_count.set.assert_called_once_with(0)
+
+
+@pytest.mark.asyncio
+async def test_sample_blocked(monitor: LoopMonitor) -> None:
+    loop = asyncio.get_running_loop()
+    # Block the loop for longer than the slow callback duration
+    loop.call_soon(time.sleep, 0.1)
+
+    lag = await monitor.sample(loop)
+
+    assert lag >= 0.05
+    assert monitor.max_lag == lag
+    monitor.slow_sample_count.set.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_run_enables_debug(monitor: LoopMonitor) -> None:
+    monitor.log_slow_callbacks = True
+    loop = asyncio.get_running_loop()
+    debug = loop.get_debug()
+
+    task = asyncio.ensure_future(monitor.run())
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    try:
+        assert loop.get_debug()
+        assert loop.slow_callback_duration == 0.05
+        assert monitor.lag.set.call_count >= 1
+    finally:
+        loop.set_debug(debug)
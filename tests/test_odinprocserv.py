@@ -1,13 +1,28 @@
+import asyncio
+
 import pytest
-from mock import Mock, call, patch
+from mock import ANY, AsyncMock, Mock, call, patch
 from pytest_mock import MockerFixture
 
 from odinprocservcontrol import OdinProcServConfig, OdinProcServControl
-from odinprocservcontrol.odinprocserv import builder
+from odinprocservcontrol.odinprocserv import (
+    STATUS_LENGTH,
+    StopTiming,
+    alarm,
+    builder,
+)
+from odinprocservcontrol.sequences import (
+    PressStep,
+    SequenceConfigError,
+    SequenceTimeoutError,
+)
+from odinprocservcontrol.state import RUNNING, STOPPED, load_state, save_state
 
 # Patch fixtures
 ASYNCIO_SLEEP_PATCH = "asyncio.sleep"
 ODINPROCSERV_PATCH = "odinprocservcontrol.odinprocserv"
+# Kept before the builder is patched so that tests can create a real record
+REAL_LONG_STRING_IN = builder.longStringIn
 
 
 @pytest.fixture
@@ -26,6 +41,9 @@ def control():
 @pytest.fixture(autouse=True)
 def _patch_builder(mocker: MockerFixture):
     mocker.patch.object(builder, "longOut")
+    mocker.patch.object(builder, "longStringIn")
+    mocker.patch.object(builder, "aIn")
+    mocker.patch.object(builder, "longIn")
 
 
 # Test [start, stop, restart]_processes
@@ -91,6 +109,172 @@ async def test_restart_processes_release(
         control.restart.set.assert_not_called()
 
 
+# Test _run_sequence and _phase
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_complete(control: OdinProcServControl) -> None:
+    record = Mock()
+    sequence = AsyncMock()
+
+    await control._run_sequence("START", record, sequence)
+
+    sequence.assert_awaited_once_with()
+    record.set.assert_called_once_with(0)
+    assert control.status.set.call_args[0][0].startswith("START complete")
+    assert control.status.set.call_args[1]["severity"] == alarm.NO_ALARM
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_status_record(mocker: MockerFixture) -> None:
+    mocker.patch.object(builder, "longStringIn", REAL_LONG_STRING_IN)
+    control = OdinProcServControl(
+        OdinProcServConfig(
+            prefix="BLXXY-EA-ODN",
+            process_count=1,
+            server_process_name="BLXXY-EA-ODN-01",
+            server_delay=3,
+            ioc_name="BLXXY-EA-IOC-01",
+            ioc_delay=5,
+        ),
+        log_level="DEBUG",
+    )
+    sequence = AsyncMock(side_effect=RuntimeError("x" * 1000))
+
+    await control._run_sequence("STOP", Mock(), sequence)
+
+    # The message is truncated to fit and the alarm is kept on the record
+    assert control.status.get().startswith("STOP failed: xxx")
+    assert len(control.status.get()) == STATUS_LENGTH - 1
+    # softioc keeps the value, severity and alarm status until the record processes
+    _, severity, status, _ = control.status._value
+    assert (severity, status) == (alarm.MAJOR_ALARM, alarm.STATE_ALARM)
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_timeout(control: OdinProcServControl) -> None:
+    control.config.sequence_timeout = 0.01
+    record = Mock()
+
+    await control._run_sequence("START", record, lambda: asyncio.sleep(1))
+
+    record.set.assert_called_once_with(0)
+    control.status.set.assert_called_with(
+        "START timed out after 0.01s",
+        severity=alarm.MAJOR_ALARM,
+        alarm=alarm.TIMEOUT_ALARM,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_phase_timeout(control: OdinProcServControl) -> None:
+    control.config.phase_timeout = 0.01
+    record = Mock()
+
+    async def sequence():
+        await control._phase("start server", asyncio.sleep(1))
+
+    await control._run_sequence("START", record, sequence)
+
+    record.set.assert_called_once_with(0)
+    control.status.set.assert_called_with(
+        "START failed: start server timed out after 0.01s",
+        severity=alarm.MAJOR_ALARM,
+        alarm=alarm.TIMEOUT_ALARM,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_error(control: OdinProcServControl) -> None:
+    record = Mock()
+    sequence = AsyncMock(side_effect=RuntimeError("caput failed"))
+
+    await control._run_sequence("STOP", record, sequence)
+
+    record.set.assert_called_once_with(0)
+    control.status.set.assert_called_with(
+        "STOP failed: caput failed",
+        severity=alarm.MAJOR_ALARM,
+        alarm=alarm.STATE_ALARM,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_cancelled(control: OdinProcServControl) -> None:
+    record = Mock()
+    task = asyncio.ensure_future(
+        control._run_sequence("RESTART", record, lambda: asyncio.sleep(1))
+    )
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    record.set.assert_called_once_with(0)
+    control.status.set.assert_called_with(
+        "RESTART cancelled", severity=alarm.MAJOR_ALARM, alarm=alarm.STATE_ALARM
+    )
+
+
+def _recording_sequence(events, name, seconds=0.01):
+    async def sequence():
+        events.append(name + " start")
+        await asyncio.sleep(seconds)
+        events.append(name + " end")
+
+    return sequence
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_serialised(control: OdinProcServControl) -> None:
+    events: list = []
+
+    await asyncio.gather(
+        control._run_sequence("START", Mock(), _recording_sequence(events, "START")),
+        control._run_sequence("TEST", Mock(), _recording_sequence(events, "TEST")),
+    )
+
+    assert events == ["START start", "START end", "TEST start", "TEST end"]
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_preempted(control: OdinProcServControl) -> None:
+    events: list = []
+    start, waiting, stop = Mock(), Mock(), Mock()
+
+    # START hangs, and TEST is waiting behind it
+    commands = [
+        asyncio.ensure_future(
+            control._run_sequence(
+                "START", start, _recording_sequence(events, "START", 10)
+            )
+        ),
+        asyncio.ensure_future(
+            control._run_sequence("TEST", waiting, _recording_sequence(events, "TEST"))
+        ),
+    ]
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(
+        control._run_sequence(
+            "STOP", stop, _recording_sequence(events, "STOP"), preempt=True
+        ),
+        1,
+    )
+    await asyncio.gather(*commands)
+
+    # STOP cancelled both instead of waiting for them
+    assert events == ["START start", "STOP start", "STOP end"]
+    for record in (start, waiting, stop):
+        record.set.assert_called_once_with(0)
+    control.status.set.assert_any_call(
+        "START cancelled by STOP", severity=alarm.MAJOR_ALARM, alarm=alarm.STATE_ALARM
+    )
+    control.status.set.assert_any_call(
+        "TEST cancelled by STOP", severity=alarm.MAJOR_ALARM, alarm=alarm.STATE_ALARM
+    )
+    assert control.status.set.call_args[0][0].startswith("STOP complete")
+
+
 # Test _[start, stop, restart]_processes
 
 
@@ -206,6 +390,392 @@ async def test__restart_processes(
     await sleep_mock.stop()
 
 
+# Test stop escalation
+
+
+@pytest.fixture
+def escalating_control(control: OdinProcServControl) -> OdinProcServControl:
+    control.targets = control.targets.from_config(
+        ["BLXXY-EA-ODN-02", "BLXXY-EA-ODN-03"],
+        "BLXXY-EA-ODN-01",
+        "BLXXY-EA-IOC-01",
+        overrides={"BLXXY-EA-ODN-03": {"kill_timeout": 1}},
+        defaults=dict(stop_timeout=1),
+    )
+    return control
+
+
+@pytest.mark.asyncio
+async def test__stop_processes_escalates(
+    escalating_control: OdinProcServControl,
+) -> None:
+    control = escalating_control
+    press_mock = patch.object(control, "_press_buttons").start()
+    escalate_mock = patch.object(
+        control, "_escalate_stop", return_value=StopTiming(stop=0.1)
+    ).start()
+
+    await control._stop_processes()
+
+    press_mock.assert_awaited_once_with(control.targets.names, "STOP")
+    assert escalate_mock.await_count == 4
+    assert list(control.stop_timings) == control.targets.names
+
+    patch.stopall()
+
+
+@pytest.mark.asyncio
+async def test__confirm_stopped_failure(
+    escalating_control: OdinProcServControl,
+) -> None:
+    control = escalating_control
+    with patch.object(
+        control, "_escalate_stop", return_value=StopTiming(stop=1, stopped=False)
+    ):
+        with pytest.raises(RuntimeError, match="Did not exit: BLXXY-EA-ODN-02"):
+            await control._confirm_stopped(["BLXXY-EA-ODN-02"])
+
+
+@pytest.mark.asyncio
+async def test__confirm_stopped_completes_on_error(
+    escalating_control: OdinProcServControl,
+) -> None:
+    control = escalating_control
+
+    async def escalate(target):
+        if target.name == "BLXXY-EA-ODN-02":
+            await asyncio.sleep(0.01)
+            raise RuntimeError("caput failed")
+        # The others finish after the failure
+        await asyncio.sleep(0.05)
+        return StopTiming(stop=0.05, stopped=target.name != "BLXXY-EA-ODN-03")
+
+    with patch.object(control, "_escalate_stop", side_effect=escalate):
+        with pytest.raises(RuntimeError) as excinfo:
+            await control._confirm_stopped(control.targets.names)
+
+    assert str(excinfo.value) == (
+        "Did not exit: BLXXY-EA-ODN-02 (caput failed), BLXXY-EA-ODN-03"
+    )
+    assert control.stop_timings == {
+        "BLXXY-EA-ODN-01": StopTiming(stop=0.05),
+        "BLXXY-EA-ODN-03": StopTiming(stop=0.05, stopped=False),
+        "BLXXY-EA-IOC-01": StopTiming(stop=0.05),
+    }
+
+
+@pytest.mark.asyncio
+async def test__confirm_stopped_cancelled(
+    escalating_control: OdinProcServControl,
+) -> None:
+    control = escalating_control
+    killed = []
+
+    async def escalate(target):
+        await asyncio.sleep(0.05)
+        killed.append(target.name)
+
+    with patch.object(control, "_escalate_stop", side_effect=escalate):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                control._confirm_stopped(control.targets.names), 0.01
+            )
+        await asyncio.sleep(0.1)
+
+    # No escalation outlives a cancelled stop
+    assert killed == []
+
+
+@pytest.mark.asyncio
+async def test__confirm_stopped_skips_without_timeout(
+    control: OdinProcServControl,
+) -> None:
+    with patch.object(control, "_escalate_stop") as escalate_mock:
+        await control._confirm_stopped(control.targets.names)
+        escalate_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__escalate_stop_exits(escalating_control: OdinProcServControl) -> None:
+    control = escalating_control
+    with patch.object(control, "_wait_for_exit", return_value=True), patch.object(
+        control, "_press_buttons"
+    ) as press_mock:
+        timing = await control._escalate_stop(control.targets["BLXXY-EA-ODN-03"])
+
+    assert timing.stopped and timing.kill is None
+    press_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__escalate_stop_kills(escalating_control: OdinProcServControl) -> None:
+    control = escalating_control
+    with patch.object(
+        control, "_wait_for_exit", side_effect=[False, True]
+    ) as wait_mock, patch.object(control, "_press_buttons") as press_mock:
+        timing = await control._escalate_stop(control.targets["BLXXY-EA-ODN-03"])
+
+    assert timing.stopped and timing.kill is not None
+    press_mock.assert_awaited_once_with(["BLXXY-EA-ODN-03"], "KILL")
+    assert wait_mock.await_args_list == [
+        call("BLXXY-EA-ODN-03", 1),
+        call("BLXXY-EA-ODN-03", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test__escalate_stop_no_kill(escalating_control: OdinProcServControl) -> None:
+    control = escalating_control
+    with patch.object(control, "_wait_for_exit", return_value=False), patch.object(
+        control, "_press_buttons"
+    ) as press_mock:
+        timing = await control._escalate_stop(control.targets["BLXXY-EA-ODN-02"])
+
+    assert not timing.stopped and timing.kill is None
+    press_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__wait_for_exit(control: OdinProcServControl) -> None:
+    with patch(ODINPROCSERV_PATCH + ".caget", side_effect=[1, 1, 0]) as caget_mock:
+        with patch(ODINPROCSERV_PATCH + ".STOP_POLL_INTERVAL", 0.001):
+            assert await control._wait_for_exit("A", 1)
+        assert caget_mock.await_count == 3
+        caget_mock.assert_awaited_with("A:STATUS", timeout=0.001)
+
+
+@pytest.mark.asyncio
+async def test__wait_for_exit_timeout(control: OdinProcServControl) -> None:
+    with patch(ODINPROCSERV_PATCH + ".caget", return_value=1):
+        assert not await control._wait_for_exit("A", 0.01)
+
+
+# Test state persistence
+
+
+@pytest.fixture
+def stateful_control(control: OdinProcServControl, tmp_path) -> OdinProcServControl:
+    control.config.state_file = str(tmp_path / "state.json")
+    return control
+
+
+@pytest.mark.asyncio
+async def test_state_saved_after_sequence(
+    stateful_control: OdinProcServControl,
+) -> None:
+    control = stateful_control
+    control.stop_timings["BLXXY-EA-ODN-02"] = StopTiming(stop=1.0)
+
+    with patch.object(control, "_press_buttons"):
+        await control._run_sequence("STOP", Mock(), control._stop_processes)
+
+    state = load_state(str(control.config.state_file))
+    assert state.intended == STOPPED
+    assert state.autorestart is False
+    assert "STOP" in state.sequence_durations
+    assert state.stop_timings == {"BLXXY-EA-ODN-02": StopTiming(stop=1.0)}
+
+
+@pytest.mark.asyncio
+async def test_state_loaded_at_startup(
+    stateful_control: OdinProcServControl,
+) -> None:
+    control = stateful_control
+    control.state.intended = RUNNING
+    control.stop_timings["BLXXY-EA-ODN-02"] = StopTiming(stop=2.0)
+    control.stop_timings["REMOVED-TARGET"] = StopTiming(stop=2.0)
+    await control._save_state()
+
+    restored = OdinProcServControl(control.config, log_level="DEBUG")
+
+    assert restored.state.intended == RUNNING
+    assert restored.stop_timings == {"BLXXY-EA-ODN-02": StopTiming(stop=2.0)}
+
+
+@pytest.mark.asyncio
+async def test_save_state_in_executor(stateful_control: OdinProcServControl) -> None:
+    control = stateful_control
+    with patch(ODINPROCSERV_PATCH + ".save_state", wraps=save_state) as save_mock:
+        await control._save_state()
+        control.state.intended = RUNNING
+
+    # The loop was free while the file was written, and later changes are not saved
+    saved = save_mock.call_args[0][1]
+    assert saved is not control.state
+    assert load_state(str(control.config.state_file)).intended != RUNNING
+
+
+class _Status(int):
+    """Stand-in for an aioca augmented int value"""
+
+    ok = True
+
+
+def _status_values(control: OdinProcServControl, stopped=(), unreachable=()):
+    values = []
+    for name in control.targets.names:
+        value = _Status(0 if name in stopped else 1)
+        value.ok = name not in unreachable
+        values.append(value)
+    return values
+
+
+@pytest.mark.asyncio
+async def test_resync(control: OdinProcServControl) -> None:
+    control.state.intended = RUNNING
+    values = _status_values(
+        control, stopped=["BLXXY-EA-ODN-02"], unreachable=["BLXXY-EA-ODN-03"]
+    )
+    with patch(ODINPROCSERV_PATCH + ".caget", return_value=values) as caget_mock:
+        with patch.object(control, "_run_sequence") as run_mock:
+            await control.resync()
+
+    caget_mock.assert_awaited_once_with(
+        [name + ":STATUS" for name in control.targets.names], timeout=0.5, throw=False
+    )
+    run_mock.assert_not_called()
+    control.status.set.assert_called_with(
+        "Resync: 10 running, 1 stopped, 1 unreachable",
+        severity=alarm.NO_ALARM,
+        alarm=alarm.NO_ALARM,
+    )
+
+
+@pytest.mark.asyncio
+async def test_resync_restore(control: OdinProcServControl) -> None:
+    control.state.intended = RUNNING
+    control.config.restore_state = True
+    values = _status_values(control, stopped=["BLXXY-EA-ODN-02"])
+    with patch(ODINPROCSERV_PATCH + ".caget", return_value=values):
+        with patch.object(control, "_run_sequence") as run_mock:
+            await control.resync()
+
+    run_mock.assert_awaited_once_with("RESTORE", control.start, ANY)
+    assert run_mock.call_args[0][2].args == (["BLXXY-EA-ODN-02"],)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("autorestart", [True, False])
+async def test__restore_processes(
+    autorestart: bool, control: OdinProcServControl
+) -> None:
+    control.config.server_delay = control.config.ioc_delay = 0
+    control.state.autorestart = autorestart
+    stopped = ["BLXXY-EA-ODN-02", "BLXXY-EA-ODN-05", "BLXXY-EA-IOC-01"]
+
+    with patch.object(control, "_press_buttons") as press_mock:
+        await control._restore_processes(stopped)
+
+    # Only the stopped processes are started, and autorestart is only toggled on them
+    expected = [
+        call(["BLXXY-EA-ODN-02", "BLXXY-EA-ODN-05"], "START"),
+        call(["BLXXY-EA-IOC-01"], "START"),
+    ]
+    if autorestart:
+        expected.append(call(stopped, "TOGGLE"))
+    assert press_mock.call_args_list == expected
+
+
+# Test custom sequences
+
+
+def test_sequence_records(control: OdinProcServControl) -> None:
+    control.config.sequences = {
+        "RESTART_SERVER": [{"press": {"targets": "server", "button": "RESTART"}}]
+    }
+
+    control = OdinProcServControl(control.config, log_level="DEBUG")
+
+    assert control.sequences["RESTART_SERVER"].steps == (
+        PressStep(["BLXXY-EA-ODN-01"], "RESTART"),
+    )
+    builder.longOut.assert_any_call("RESTART_SERVER", on_update=ANY)
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_press(control: OdinProcServControl) -> None:
+    control.config.sequences = {
+        "RESTART_SERVER": [{"press": {"targets": "server", "button": "RESTART"}}]
+    }
+    control = OdinProcServControl(control.config, log_level="DEBUG")
+    record = control.sequence_records["RESTART_SERVER"]
+
+    with patch.object(control, "_press_buttons") as press_mock:
+        await control.run_sequence("RESTART_SERVER", 1)
+
+    press_mock.assert_awaited_once_with(["BLXXY-EA-ODN-01"], "RESTART")
+    record.set.assert_called_once_with(0)
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_wait_deadline(control: OdinProcServControl) -> None:
+    control.config.phase_timeout = 0.01
+    control.config.sequences = {
+        "WAIT_IOC": [{"wait": {"targets": "ioc", "timeout": 0.05}}]
+    }
+    control = OdinProcServControl(control.config, log_level="DEBUG")
+
+    async def wait_for_status(names, status, timeout):
+        await asyncio.sleep(0.03)
+
+    with patch.object(control, "_wait_for_status", side_effect=wait_for_status):
+        await control.run_sequence("WAIT_IOC", 1)
+
+    # The wait is allowed its own timeout rather than the shorter phase timeout
+    assert control.status.set.call_args[0][0].startswith("WAIT_IOC complete")
+
+
+@pytest.mark.asyncio
+async def test_run_sequence_sleep_deadline(control: OdinProcServControl) -> None:
+    control.config.phase_timeout = 0.01
+    control.config.sequences = {"SLOW_STEP": [{"sleep": 0.05}]}
+    control = OdinProcServControl(control.config, log_level="DEBUG")
+
+    await control.run_sequence("SLOW_STEP", 1)
+
+    # The sleep is allowed its own duration rather than the shorter phase timeout
+    assert control.status.set.call_args[0][0].startswith("SLOW_STEP complete")
+
+
+@pytest.mark.parametrize("name", ["STATUS", "WHOAMI", "HOSTNAME", "LOOP_LAG"])
+def test_sequence_reserved_names(name: str, control: OdinProcServControl) -> None:
+    control.config.sequences = {name: [{"sleep": 1}]}
+
+    with pytest.raises(SequenceConfigError):
+        OdinProcServControl(control.config, log_level="DEBUG")
+
+
+@pytest.mark.asyncio
+async def test__wait_for_status(control: OdinProcServControl) -> None:
+    polls = [[_Status(1), _Status(0)], [_Status(0), _Status(0)]]
+    with patch(ODINPROCSERV_PATCH + ".caget", side_effect=polls) as caget_mock:
+        with patch(ODINPROCSERV_PATCH + ".STOP_POLL_INTERVAL", 0.001):
+            await control._wait_for_status(["A", "B"], STOPPED, 1)
+
+    assert caget_mock.await_count == 2
+    caget_mock.assert_awaited_with(["A:STATUS", "B:STATUS"], timeout=0.001, throw=False)
+
+
+@pytest.mark.asyncio
+async def test__wait_for_status_timeout(control: OdinProcServControl) -> None:
+    unreachable = _Status(0)
+    unreachable.ok = False
+    with patch(ODINPROCSERV_PATCH + ".caget", return_value=[_Status(0), unreachable]):
+        with pytest.raises(SequenceTimeoutError, match="A, B not running"):
+            await control._wait_for_status(["A", "B"], RUNNING, 0.01)
+
+
+# Test loop monitor
+
+
+def test_monitor(control: OdinProcServControl) -> None:
+    assert control.monitor is not None
+    assert control.monitor.interval == 1
+
+    control.config.monitor_interval = None
+    assert OdinProcServControl(control.config, log_level="DEBUG").monitor is None
+
+
 # Test [start, stop, restart]_processes
 
 
@@ -0,0 +1,228 @@
+import asyncio
+
+import pytest
+from mock import AsyncMock, Mock, call
+
+from odinprocservcontrol.sequences import (
+    GroupStep,
+    ParallelStep,
+    PressStep,
+    PutStep,
+    SequenceConfigError,
+    SleepStep,
+    Step,
+    WaitStep,
+    compile_sequences,
+)
+from odinprocservcontrol.targets import TargetRegistry
+
+
+@pytest.fixture
+def registry() -> TargetRegistry:
+    return TargetRegistry.from_config(
+        ["BLXXY-EA-FP-01", "BLXXY-EA-FW-01", "BLXXY-EA-FW-02"],
+        "BLXXY-EA-ODN-01",
+        "BLXXY-EA-IOC-01",
+    )
+
+
+def test_compile_sequences(registry: TargetRegistry):
+    sequences = compile_sequences(
+        {
+            "RESTART_FW": [
+                {"press": {"targets": "*-FW-*", "button": "STOP"}},
+                {
+                    "wait": {
+                        "targets": ["BLXXY-EA-FW-01", "BLXXY-EA-FW-02"],
+                        "status": "stopped",
+                        "timeout": 10,
+                    }
+                },
+                {"sleep": 1},
+                {
+                    "parallel": [
+                        {"press": {"targets": "*-FW-*", "button": "START"}},
+                        {
+                            "group": [
+                                {"put": {"pv": "A:CONFIG", "value": 1}},
+                                {"press": {"targets": "server", "button": "START"}},
+                            ]
+                        },
+                    ]
+                },
+            ]
+        },
+        registry,
+    )
+
+    fw = ["BLXXY-EA-FW-01", "BLXXY-EA-FW-02"]
+    assert sequences["RESTART_FW"].steps == (
+        PressStep(fw, "STOP"),
+        WaitStep(fw, "stopped", 10),
+        SleepStep(1),
+        ParallelStep(
+            (
+                PressStep(fw, "START"),
+                GroupStep(
+                    (PutStep("A:CONFIG", 1), PressStep(["BLXXY-EA-ODN-01"], "START"))
+                ),
+            )
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"lower": [{"sleep": 1}]},
+        {"START": [{"sleep": 1}]},
+        {"EMPTY": []},
+        {"BAD": [{"sleep": 1, "press": {}}]},
+        {"BAD": [{"jump": 1}]},
+        {"BAD": [{"press": {"targets": "data"}}]},
+        {"BAD": [{"press": {"targets": "MISSING", "button": "START"}}]},
+        {"BAD": [{"wait": {"targets": "data", "status": "paused", "timeout": 1}}]},
+        {"BAD": [{"wait": "data"}]},
+        {"BAD": [{"parallel": []}]},
+        {"BAD": [{"sleep": "soon"}]},
+        {"BAD": [{"press": {"targets": "data", "button": "STRAT"}}]},
+        {
+            "BAD": [
+                {
+                    "group": [
+                        {
+                            "wait": {
+                                "targets": "data",
+                                "status": "running",
+                                "timeout": 60,
+                            }
+                        }
+                    ]
+                }
+            ]
+        },
+        {"BAD": [{"parallel": [{"sleep": 60}]}]},
+        {
+            "BAD": [
+                {
+                    "group": [
+                        {"sleep": 20},
+                        {
+                            "wait": {
+                                "targets": "data",
+                                "status": "running",
+                                "timeout": 20,
+                            }
+                        },
+                    ]
+                }
+            ]
+        },
+        {
+            "BAD": [
+                {
+                    "parallel": [
+                        {"sleep": 1},
+                        {"group": [{"sleep": 20}, {"sleep": 20}]},
+                    ]
+                }
+            ]
+        },
+    ],
+)
+def test_compile_sequences_invalid(config, registry: TargetRegistry):
+    with pytest.raises(SequenceConfigError):
+        compile_sequences(config, registry, reserved=["START"], phase_timeout=30)
+
+
+def test_compile_sequences_top_level_wait(registry: TargetRegistry):
+    # A top level wait has its own deadline, so may be longer than the phase timeout
+    sequences = compile_sequences(
+        {"WAIT": [{"wait": {"targets": "ioc", "timeout": 60}}]},
+        registry,
+        phase_timeout=30,
+    )
+
+    assert sequences["WAIT"].steps == (WaitStep(["BLXXY-EA-IOC-01"], "running", 60),)
+
+
+def test_compile_sequences_top_level_sleep(registry: TargetRegistry):
+    sequences = compile_sequences(
+        {"SLEEP": [{"sleep": 60}]}, registry, phase_timeout=30
+    )
+
+    assert sequences["SLEEP"].steps == (SleepStep(60),)
+
+
+def test_compile_sequences_parallel_within_phase(registry: TargetRegistry):
+    # Parallel branches run at the same time, so only the longest one counts
+    compile_sequences(
+        {
+            "OK": [
+                {"parallel": [{"sleep": 20}, {"group": [{"sleep": 5}, {"sleep": 5}]}]}
+            ]
+        },
+        registry,
+        phase_timeout=30,
+    )
+
+
+@pytest.mark.asyncio
+async def test_steps_run():
+    control = Mock(
+        _press_buttons=AsyncMock(), _put=AsyncMock(), _wait_for_status=AsyncMock()
+    )
+    step = GroupStep(
+        (
+            PressStep(["A"], "STOP"),
+            WaitStep(["A"], "stopped", 5),
+            ParallelStep((PutStep("B:CONFIG", 2), SleepStep(0))),
+        )
+    )
+
+    await step.run(control)
+
+    assert control.method_calls == [
+        call._press_buttons(["A"], "STOP"),
+        call._wait_for_status(["A"], "stopped", 5),
+        call._put("B:CONFIG", 2),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_parallel_step_runs_concurrently():
+    running = []
+
+    class CountingStep(SleepStep):
+        async def run(self, control):
+            running.append(self.seconds)
+            await asyncio.sleep(0)
+            assert len(running) == 2
+
+    await ParallelStep((CountingStep(1), CountingStep(2))).run(Mock())
+
+
+@pytest.mark.asyncio
+async def test_parallel_step_cancels_on_failure():
+    finished = []
+
+    class FailingStep(SleepStep):
+        async def run(self, control):
+            await asyncio.sleep(self.seconds)
+            raise RuntimeError("caput failed")
+
+    class SlowStep(SleepStep):
+        async def run(self, control):
+            await asyncio.sleep(self.seconds)
+            finished.append(self)
+
+    with pytest.raises(RuntimeError, match="caput failed"):
+        await ParallelStep((FailingStep(0.01), SlowStep(0.1))).run(Mock())
+    await asyncio.sleep(0.2)
+
+    assert finished == []
+
+
+def test_step_is_abstract():
+    with pytest.raises(TypeError):
+        Step()  # type: ignore
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from odinprocservcontrol.state import (
+    RUNNING,
+    UNKNOWN,
+    ControlState,
+    StopTiming,
+    load_state,
+    save_state,
+)
+
+
+def test_save_and_load_state(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = ControlState(
+        intended=RUNNING,
+        autorestart=True,
+        stop_timings={"BLXXY-EA-ODN-02": StopTiming(stop=1.5, kill=0.5)},
+        sequence_durations={"START": 8.0},
+    )
+
+    save_state(path, state)
+
+    assert load_state(path) == state
+    assert state.updated is not None
+    # Only the state file is left behind
+    assert os.listdir(str(tmp_path)) == ["state.json"]
+
+
+def test_save_state_replaces_existing(tmp_path):
+    path = str(tmp_path / "state.json")
+    save_state(path, ControlState(intended=RUNNING))
+    save_state(path, ControlState(intended=UNKNOWN, autorestart=False))
+
+    assert load_state(path).autorestart is False
+
+
+def test_load_state_missing(tmp_path):
+    assert load_state(str(tmp_path / "missing.json")) == ControlState()
+
+
+def test_load_state_invalid(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{not json")
+    assert load_state(str(path)) == ControlState()
+
+    path.write_text("[]")
+    assert load_state(str(path)) == ControlState()
+
+
+def test_load_state_ignores_unknown_keys(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"intended": RUNNING, "future_key": 1}))
+
+    assert load_state(str(path)) == ControlState(intended=RUNNING)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"intended": "paused"},
+        {"autorestart": "yes"},
+        {"stop_timings": []},
+        {"stop_timings": {"A": 1.5}},
+        {"stop_timings": {"A": {"kill": 1}}},
+        {"stop_timings": {"A": {"stop": "1"}}},
+        {"stop_timings": {"A": {"stop": 1, "stopped": 1}}},
+        {"sequence_durations": {"START": None}},
+        {"updated": True},
+    ],
+)
+def test_load_state_invalid_field(values, tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps(values))
+
+    assert load_state(str(path)) == ControlState()
+
+
+def test_load_state_keeps_valid_fields(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"intended": RUNNING, "stop_timings": []}))
+
+    assert load_state(str(path)) == ControlState(intended=RUNNING)
+
+
+def test_load_state_ignores_unknown_stop_timing_keys(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"stop_timings": {"A": {"stop": 1.5, "future_key": 1}}}))
+
+    assert load_state(str(path)).stop_timings == {"A": StopTiming(stop=1.5)}
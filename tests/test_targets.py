@@ -0,0 +1,100 @@
+import pytest
+
+from odinprocservcontrol.targets import (
+    DATA_ROLE,
+    IOC_ROLE,
+    SERVER_ROLE,
+    ProcServTarget,
+    TargetConfigError,
+    TargetRegistry,
+    expand_process_spec,
+)
+
+
+@pytest.fixture
+def registry() -> TargetRegistry:
+    return TargetRegistry.from_config(
+        ["BLXXY-EA-FP-01", "BLXXY-EA-FP-02", "BLXXY-EA-FW-01", "BLXXY-EA-ODN-01"],
+        "BLXXY-EA-ODN-01",
+        "BLXXY-EA-IOC-01",
+        overrides={"BLXXY-EA-FP-*": {"host": "serv-02"}},
+    )
+
+
+def test_expand_process_spec():
+    assert expand_process_spec({"names": ["A", "B"]}) == ["A", "B"]
+    assert expand_process_spec({"names": "A"}) == ["A"]
+    assert expand_process_spec({"prefix": "BLXXY-EA-FP", "range": [9, 11]}) == [
+        "BLXXY-EA-FP-09",
+        "BLXXY-EA-FP-10",
+        "BLXXY-EA-FP-11",
+    ]
+    assert expand_process_spec({"prefix": "BLXXY-EA-FP", "numbers": [1, 5]}) == [
+        "BLXXY-EA-FP-01",
+        "BLXXY-EA-FP-05",
+    ]
+
+
+@pytest.mark.parametrize("spec", [{}, {"prefix": "A"}, {"prefix": "A", "range": [1]}])
+def test_expand_process_spec_invalid(spec):
+    with pytest.raises(TargetConfigError):
+        expand_process_spec(spec)
+
+
+def test_registry_indexes(registry: TargetRegistry):
+    assert registry.names == [
+        "BLXXY-EA-FP-01",
+        "BLXXY-EA-FP-02",
+        "BLXXY-EA-FW-01",
+        "BLXXY-EA-ODN-01",
+        "BLXXY-EA-IOC-01",
+    ]
+    assert registry.role(SERVER_ROLE) == ["BLXXY-EA-ODN-01"]
+    assert registry.role(IOC_ROLE) == ["BLXXY-EA-IOC-01"]
+    assert registry.host("serv-02") == ["BLXXY-EA-FP-01", "BLXXY-EA-FP-02"]
+    assert registry["BLXXY-EA-FP-01"] == ProcServTarget(
+        "BLXXY-EA-FP-01", DATA_ROLE, "serv-02"
+    )
+    assert "BLXXY-EA-FW-01" in registry
+    assert len(registry) == 5
+
+
+def test_registry_server_not_in_data_processes():
+    registry = TargetRegistry.from_config(["A", "B"], "SERVER", "IOC")
+    assert registry.names == ["A", "B", "SERVER", "IOC"]
+
+
+def test_registry_select(registry: TargetRegistry):
+    assert registry.select("data") == registry.role(DATA_ROLE)
+    assert registry.select("BLXXY-EA-FW-01") == ["BLXXY-EA-FW-01"]
+    assert registry.select("*-FP-*") == ["BLXXY-EA-FP-01", "BLXXY-EA-FP-02"]
+    assert registry.select("host:serv-02") == ["BLXXY-EA-FP-01", "BLXXY-EA-FP-02"]
+    assert registry.select(["server", "ioc", "BLXXY-EA-ODN-01"]) == [
+        "BLXXY-EA-ODN-01",
+        "BLXXY-EA-IOC-01",
+    ]
+    with pytest.raises(TargetConfigError):
+        registry.select("MISSING")
+
+
+@pytest.mark.parametrize(
+    "data, overrides",
+    [
+        (["A", "A"], {}),
+        ([""], {}),
+        (["A"], {"B*": {"host": "x"}}),
+        (["A"], {"A": {"timeout": 1}}),
+        (["A"], {"A": {"role": "server"}}),
+        (["A"], {"A": {"role": "detector"}}),
+        (["A", "B"], {"A": {"role": "data"}, "B": {"role": "server"}}),
+        (["A"], {"A": {"stop_timeout": "10"}}),
+        (["A"], {"A": {"stop_timeout": -1}}),
+        (["A"], {"A": {"kill_timeout": True}}),
+        (["A"], {"A": {"kill_timeout": [5]}}),
+        (["A"], {"A": {"host": 1}}),
+        (["A"], {"*": {"host": False}}),
+    ],
+)
+def test_registry_invalid(data, overrides):
+    with pytest.raises(TargetConfigError):
+        TargetRegistry.from_config(data, "SERVER", "IOC", overrides)